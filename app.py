@@ -1,47 +1,113 @@
-from flask import Flask, render_template, redirect, url_for, flash, jsonify, request
+from flask import Flask, Blueprint, render_template, redirect, url_for, flash, jsonify, request, abort, make_response, current_app, stream_with_context
+import json
 import os
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.sql.expression import func
-from flask_bcrypt import Bcrypt
+import uuid
+import zipfile
+from dataclasses import asdict
+import click
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from flask_migrate import Migrate
+from flask_migrate import Migrate, stamp
+from flask.cli import with_appcontext
+from sqlalchemy import inspect
 from forms import RegistrationForm, LoginForm, ProductForm
-from models import db, User, Product, CartItem
-from werkzeug.utils import secure_filename
+from models import db, User, Product, FulfillmentJob
 from werkzeug.middleware.proxy_fix import ProxyFix
-import stripe
 from dotenv import load_dotenv
-from send_email import send_email
-
-# Load environment variables from .env
-load_dotenv()
-
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'supersecretkey'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SERVER_NAME'] = 'bytemarket.duckdns.org'
-
-app.wsgi_app = ProxyFix(
-    app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1
+from fulfillment import fulfillment_queue
+from downloads import download_url, read_download_token, send_download
+from attachments import attachment_cache
+from mail_transport import mail_transport
+from stripe_catalog import stripe_catalog, CheckoutUnavailable
+import images
+import query_plans
+import facets
+import bulk_import
+from assets import static_assets
+from metrics import instrumentation
+from passwords import password_hasher, login_throttle, HashingBusy
+from db_profile import configure_database, install_pragmas, writes_db
+from search import ensure_search_index, search_catalog
+from listings import InvalidCursor, InvalidPriceRange, page_size, price_range, price_range_page
+from suggest import suggestion_index, SUGGEST_LIMIT, MAX_SUGGEST_LIMIT
+from cache import catalog_cache, user_cache
+from featured import featured_products
+from http_cache import http_cache
+from storage import blob_store, BlobTooLarge
+from cart_service import (
+    load_cart, clear_cart, add_item, set_quantity, remove_item, apply_batch,
+    require_positive_int, CartError,
 )
 
-# Stripe configuration
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
-STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY")
-
-# Initialize extensions
-db.init_app(app)
-bcrypt = Bcrypt(app)
-migrate = Migrate(app, db)
-
-login_manager = LoginManager(app)
-login_manager.login_view = "login"
+migrate = Migrate()
+login_manager = LoginManager()
+login_manager.login_view = "main.login"
 login_manager.login_message_category = "info"
 
+# Views live on a blueprint that create_app() registers
+bp = Blueprint("main", __name__)
+
+def create_app(config=None):
+    """Builds a configured app; `config` overrides the defaults below.
+
+    Nothing touches the database here. The schema and sample data come from
+    `flask init-db` / `flask db upgrade` and `flask seed-db`, and the Stripe and
+    Mailjet clients are built on first use, so workers boot fast and fork
+    without open connections.
+    """
+    # Load environment variables from .env
+    load_dotenv()
+
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'supersecretkey'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SERVER_NAME'] = 'bytemarket.duckdns.org'
+    app.config['PREFERRED_URL_SCHEME'] = 'https'
+    app.config['DELIVERY_MODE'] = os.getenv('DELIVERY_MODE', 'attachments') # attachments or links
+    app.config['DOWNLOAD_LINK_MAX_AGE'] = 7 * 24 * 60 * 60
+    app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE') == '1' # Apache/lighttpd offload
+    app.config['DOWNLOAD_ACCEL_REDIRECT_PREFIX'] = os.getenv('DOWNLOAD_ACCEL_REDIRECT_PREFIX') # nginx offload, e.g. /protected
+    # Stripe configuration
+    app.config['STRIPE_PUBLISHABLE_KEY'] = os.getenv("STRIPE_PUBLISHABLE_KEY")
+    if config:
+        app.config.from_mapping(config)
+
+    app.wsgi_app = ProxyFix(
+        app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1
+    )
+
+    # Initialize extensions
+    configure_database(app)
+    db.init_app(app)
+    install_pragmas(app, db)
+    password_hasher.init_app(app)
+    login_throttle.init_app(app)
+    migrate.init_app(app, db)
+    catalog_cache.init_app(app)
+    user_cache.init_app(app)
+    featured_products.init_app(app)
+    suggestion_index.init_app(app)
+    fulfillment_queue.init_app(app)
+    attachment_cache.init_app(app)
+    mail_transport.init_app(app)
+    stripe_catalog.init_app(app)
+    images.init_app(app)
+    static_assets.init_app(app)
+    http_cache.init_app(app)
+    blob_store.init_app(app)
+    query_plans.init_app(app)
+    facets.init_app(app)
+    bulk_import.init_app(app)
+    instrumentation.init_app(app, db)
+    login_manager.init_app(app)
+
+    app.register_blueprint(bp)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(seed_db_command)
+    return app
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.load(int(user_id))
 
 # Create sample data if needed
 def create_sample_products():
@@ -191,254 +257,436 @@ def create_sample_products():
 
     db.session.commit()
 
-with app.app_context():
+@click.command("init-db")
+@with_appcontext
+def init_db_command():
+    """Creates the tables and search index of a new database."""
+    if inspect(db.engine).has_table("product"):
+        click.echo("The database already exists; run `flask db upgrade` to migrate it.")
+        return
     db.create_all()
+    ensure_search_index()
+    # create_all() builds the current schema, so there is nothing left to migrate
+    stamp()
+    click.echo("Initialized the database.")
+
+@click.command("seed-db")
+@with_appcontext
+def seed_db_command():
+    """Adds the sample products to an empty catalog."""
     create_sample_products()
+    click.echo("Sample products are in place.")
 
-@app.route("/")
+@bp.route("/")
 def home():
-    products = Product.query.order_by(func.random()).limit(6).all()
+    products = featured_products.get()
     return render_template("index.html", products=products)
 
 # Searching
-@app.route("/api/search", methods=["GET"])
+@bp.route("/api/search", methods=["GET"])
 def search_products():
     query = request.args.get("q", "")
     if not query:
         return jsonify({"success": False, "message": "No search query provided"}), 400
 
-    products = Product.query.filter(Product.product_name.icontains(query)).all()
-
-    results = []
-    for product in products:
-        results.append({
-            "id": product.id,
-            "name": product.product_name,
-            "description": product.description[:100] + "..." if len(product.description) > 100 else product.description,
-            "price": product.price,
-            "image_path": product.image_path
-        })
-
-    return jsonify({"success": True, "results": results, "count": len(results)})
-
-@app.route("/category/<category_name>")
+    def render():
+        try:
+            page = search_catalog(query, request.args.get("cursor"), page_size(request.args.get("limit", type=int)))
+        except InvalidCursor as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        results = []
+        for product in page.items:
+            results.append({
+                "id": product.id,
+                "name": product.product_name,
+                "description": product.description,
+                "price": product.price,
+                "image_path": product.image_path,
+                "thumbnail_path": images.product_image(product)["src"]
+            })
+
+        return jsonify({"success": True, "results": results, "count": len(results), "next_cursor": page.next_cursor})
+
+    return http_cache.respond(http_cache.for_catalog(), render)
+
+# Typeahead for the search box, answered from the in-memory index
+@bp.route("/api/suggest", methods=["GET"])
+def suggest_products():
+    limit = request.args.get("limit", SUGGEST_LIMIT, type=int)
+    suggestions = suggestion_index.suggest(request.args.get("q", ""), max(1, min(limit, MAX_SUGGEST_LIMIT)))
+    return jsonify({"success": True, "suggestions": suggestions})
+
+@bp.route("/category/<category_name>")
 def category(category_name):
-    products = Product.query.filter_by(category=category_name).all()
-    return render_template("_products.html", products=products)
+    cursor = request.args.get("cursor")
+    limit = page_size(request.args.get("limit", type=int))
+    try:
+        prices = price_range(request.args.get("min_price", type=float), request.args.get("max_price", type=float))
+    except InvalidPriceRange:
+        abort(400)
+
+    def render():
+        try:
+            if prices:
+                # Filtered listings run cheapest first along the (category, price) index
+                page = price_range_page(category_name, prices, cursor, limit)
+            else:
+                page = catalog_cache.get_category_page(category_name, cursor, limit)
+        except InvalidCursor:
+            abort(400)
+
+        # The first page is the whole listing fragment; later ones are just more cards for product.js to append
+        template = "_product_cards.html" if cursor else "_products.html"
+        response = make_response(render_template(template, products=page.items))
+        if page.next_cursor:
+            next_url = url_for(
+                "main.category", category_name=category_name, cursor=page.next_cursor, limit=request.args.get("limit"),
+                min_price=prices.low, max_price=prices.high,
+            )
+            response.headers["Link"] = f'<{next_url}>; rel="next"'
+        return response
+
+    return http_cache.respond(http_cache.for_catalog(vary_cookie=True), render)
+
+# Product counts per category and a price histogram, from the facet aggregate
+@bp.route("/api/facets", methods=["GET"])
+def browse_facets():
+    try:
+        prices = price_range(request.args.get("min_price", type=float), request.args.get("max_price", type=float))
+    except InvalidPriceRange as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    category_name = request.args.get("category") or None
+    return http_cache.respond(
+        http_cache.for_catalog(),
+        lambda: jsonify(dict(facets.browse_facets(category_name, prices), success=True)),
+    )
 
 # Auth Routes
-@app.route("/register", methods=["GET", "POST"])
+@bp.route("/register", methods=["GET", "POST"])
 def register():
     form = RegistrationForm()
     if form.validate_on_submit():
         if User.query.filter_by(email=form.email.data).first():
             flash("Email already registered.", "danger")
-            return redirect(url_for("login"))
-        hashed = bcrypt.generate_password_hash(form.password.data).decode("utf-8")
+            return redirect(url_for("main.login"))
+        # Every registration costs a hash, so it counts against the client's password-check budget
+        if not login_throttle.allow(request.remote_addr):
+            flash("Too many attempts. Try again in a few minutes.", "danger")
+            return render_template("register.html", form=form), 429
+        login_throttle.record(request.remote_addr)
+        try:
+            hashed = password_hasher.hash(form.password.data)
+        except HashingBusy:
+            flash("We're busy right now. Please try again.", "danger")
+            return render_template("register.html", form=form), 503
         user = User(username=form.username.data, email=form.email.data, password_hash=hashed)
         db.session.add(user)
         db.session.commit()
         flash("Account created! Log in now.", "success")
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
     return render_template("register.html", form=form)
 
-@app.route("/login", methods=["GET", "POST"])
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(email=form.email.data).first()
-        if user and bcrypt.check_password_hash(user.password_hash, form.password.data):
+        ip, email = request.remote_addr, form.email.data
+        if not login_throttle.allow(ip, email):
+            flash("Too many login attempts. Try again in a few minutes.", "danger")
+            return render_template("login.html", form=form), 429
+        user = User.query.filter_by(email=email).first()
+        try:
+            valid = user is not None and password_hasher.verify(form.password.data, user.password_hash)
+            login_throttle.record(ip, email, success=valid)
+            if valid and password_hasher.needs_rehash(user.password_hash):
+                # BCRYPT_LOG_ROUNDS changed since this hash was made
+                user.password_hash = password_hasher.hash(form.password.data)
+                db.session.commit()
+        except HashingBusy:
+            flash("We're busy right now. Please try again.", "danger")
+            return render_template("login.html", form=form), 503
+        if valid:
             login_user(user)
             flash("Logged in!", "success")
-            return redirect(url_for("home"))
+            return redirect(url_for("main.home"))
         flash("Login failed.", "danger")
     return render_template("login.html", form=form)
 
-@app.route("/logout")
+@bp.route("/logout")
 @login_required
 def logout():
     logout_user()
     flash("Logged out.", "info")
-    return redirect(url_for("home"))
+    return redirect(url_for("main.home"))
 
-@app.route("/account")
+@bp.route("/account")
 @login_required
 def account():
     return render_template("account.html")
 
-@app.route("/edit_account", methods=["GET", "POST"])
+@bp.route("/edit_account", methods=["GET", "POST"])
 @login_required
 def edit_account():
     form = RegistrationForm()
     if form.validate_on_submit():
-        current_user.username = form.username.data
-        current_user.email = form.email.data
+        # current_user is a cached snapshot, so changes go through the User row
+        user = db.session.get(User, current_user.id)
+        user.username = form.username.data
+        user.email = form.email.data
         if form.password.data:
-            current_user.password_hash = bcrypt.generate_password_hash(form.password.data).decode("utf-8")
+            try:
+                user.password_hash = password_hasher.hash(form.password.data)
+            except HashingBusy:
+                db.session.rollback()
+                flash("We're busy right now. Please try again.", "danger")
+                return render_template("edit_account.html", form=form), 503
         db.session.commit()
+        user_cache.invalidate(user.id)
         flash("Account updated.", "success")
-        return redirect(url_for("account"))
+        return redirect(url_for("main.account"))
     form.username.data = current_user.username
     form.email.data = current_user.email
     return render_template("edit_account.html", form=form)
 
 # Seller Upload API
-@app.route("/upload_product", methods=["GET", "POST"])
+@bp.route("/upload_product", methods=["GET", "POST"])
 @login_required
 def upload_product():
     if current_user.role not in ['seller', 'admin']:
         flash("No permission to upload.", "danger")
-        return redirect(url_for("account"))
+        return redirect(url_for("main.account"))
     form = ProductForm()
     if form.validate_on_submit():
-        image = form.image.data
-        filename = secure_filename(image.filename)
-        folder = os.path.join(app.static_folder, 'product_images')
-        os.makedirs(folder, exist_ok=True)
-        image.save(os.path.join(folder, filename))
-        path = os.path.join('product_images', filename).replace(os.sep, '/')
+        staged_image = staged_file = None
+        try:
+            staged_image = blob_store.stage(form.image.data.stream, form.image.data.filename, "image")
+            staged_file = blob_store.stage(form.file.data.stream, form.file.data.filename, "file")
+        except BlobTooLarge as e:
+            blob_store.discard(staged_image)
+            flash(str(e), "danger")
+            return render_template("upload_product.html", form=form), 413
+        # Before the write transaction, which only takes the references and inserts the product
+        variants = images.try_process_image(current_app.static_folder, staged_image.path, staged_image.staged)
+        image = blob_store.commit(staged_image)
+        download = blob_store.commit(staged_file)
         product = Product(
             product_name=form.product_name.data,
             description=form.description.data,
             price=form.price.data,
             category=form.category.data,
-            image_path=path,
-            file_path=f"{form.category.data}/{form.product_name.data}", # Need to figure out how to add file extension at the end
+            image_path=image.path,
+            image_variants=variants,
+            file_path=download.path,
+            file_size=download.size,
             user_id=current_user.id
         )
         db.session.add(product)
+        http_cache.bump_catalog_version()
         db.session.commit()
+        if stripe_catalog.try_ensure_price(product):
+            db.session.commit()
+        catalog_cache.invalidate(product)
+        featured_products.add(product.id)
+        suggestion_index.add(product)
         flash("Product uploaded!", "success")
-        return redirect(url_for("account"))
+        return redirect(url_for("main.account"))
     return render_template("upload_product.html", form=form)
 
-@app.route("/product/<int:product_id>")
+# Bulk upload: a CSV/JSONL manifest plus a zip of its images and files.
+# Progress streams back as JSON lines: one per failed row, then the summary.
+@bp.route("/api/products/import", methods=["POST"])
+@login_required
+@writes_db
+def import_products():
+    if current_user.role not in ['seller', 'admin']:
+        return jsonify(success=False, message="No permission to upload."), 403
+    manifest, archive = request.files.get("manifest"), request.files.get("archive")
+    if not manifest or not archive:
+        return jsonify(success=False, message="Send a manifest and an archive"), 400
+    try:
+        zip_archive = zipfile.ZipFile(archive.stream)
+    except zipfile.BadZipFile:
+        return jsonify(success=False, message="The archive is not a zip file"), 400
+
+    events = bulk_import.run_import(manifest.stream, bulk_import.manifest_format(manifest.filename or ""), zip_archive, current_user.id)
+
+    def stream():
+        with zip_archive:
+            for event in events:
+                line = asdict(event)
+                if isinstance(event, bulk_import.ImportSummary):
+                    line["success"] = True
+                yield json.dumps(line) + "\n"
+
+    return current_app.response_class(stream_with_context(stream()), mimetype="application/x-ndjson")
+
+@bp.route("/product/<int:product_id>")
 def product(product_id):
-    product = Product.query.get_or_404(product_id)
-    return render_template("product.html", product=product)
+    product = catalog_cache.get_product(product_id)
+    if product is None:
+        abort(404)
+    return http_cache.respond(http_cache.for_product(product), lambda: render_template("product.html", product=product))
 
 # Cart API Routes
-@app.route("/cart")
+@bp.route("/cart")
 @login_required
 def cart():
     return render_template("cart.html")
 
-@app.route("/api/cart", methods=["GET"])
+def cart_json(user_id):
+    return [{
+        "id": line.id,
+        "product_id": line.product_id,
+        "name": line.name,
+        "price": line.price,
+        "quantity": line.quantity,
+        "total": line.total,
+        "image_url": "/static/" + line.image_path,
+        "thumbnail_url": "/static/" + images.product_image(line)["src"]
+    } for line in load_cart(user_id)]
+
+@bp.route("/api/cart", methods=["GET"])
 @login_required
 def get_cart():
-    items = CartItem.query.filter_by(user_id=current_user.id).all()
-    cart = [{
-        "id": item.id,
-        "product_id": item.product_id,
-        "name": item.product.product_name,
-        "price": item.product.price,
-        "quantity": item.quantity,
-        "total": item.product.price * item.quantity,
-        "image_url": "/static/" + item.product.image_path
-    } for item in items]
-    return jsonify(success=True, cart_items=cart)
-
-@app.route("/api/cart/add", methods=["POST"])
+    return jsonify(success=True, cart_items=cart_json(current_user.id))
+
+@bp.route("/api/cart/add", methods=["POST"])
 @login_required
 def add_to_cart():
     data = request.get_json()
-    product_id = data.get("product_id")
-    quantity = data.get("quantity", 1)
-    item = CartItem.query.filter_by(user_id=current_user.id, product_id=product_id).first()
-    if item:
-        item.quantity += quantity
-    else:
-        item = CartItem(user_id=current_user.id, product_id=product_id, quantity=quantity)
-        db.session.add(item)
+    try:
+        product_id = require_positive_int(data.get("product_id"), "product_id")
+        quantity = require_positive_int(data.get("quantity", 1), "quantity")
+    except CartError as e:
+        return jsonify(success=False, message=str(e)), 400
+    add_item(current_user.id, product_id, quantity)
     db.session.commit()
     return jsonify(success=True)
 
-@app.route("/api/cart/update/<int:item_id>", methods=["POST"])
+@bp.route("/api/cart/update/<int:item_id>", methods=["POST"])
 @login_required
 def update_cart(item_id):
-    data = request.get_json()
-    qty = data.get("quantity", 1)
-    if qty < 1:
-        return jsonify(success=False, message="Minimum quantity is 1"), 400
-    item = CartItem.query.filter_by(id=item_id, user_id=current_user.id).first()
-    if not item:
+    data = request.get_json(silent=True) or {}
+    try:
+        qty = require_positive_int(data.get("quantity", 1), "quantity")
+    except CartError as e:
+        return jsonify(success=False, message=str(e)), 400
+    if not set_quantity(current_user.id, item_id, qty):
         return jsonify(success=False), 404
-    item.quantity = qty
     db.session.commit()
     return jsonify(success=True)
 
-@app.route("/api/cart/remove/<int:item_id>", methods=["DELETE"])
+@bp.route("/api/cart/remove/<int:item_id>", methods=["DELETE"])
 @login_required
 def remove_cart(item_id):
-    item = CartItem.query.filter_by(id=item_id, user_id=current_user.id).first()
-    if not item:
+    if not remove_item(current_user.id, item_id):
         return jsonify(success=False), 404
-    db.session.delete(item)
     db.session.commit()
     return jsonify(success=True)
 
+# Applies a list of add/update/remove operations in one transaction
+@bp.route("/api/cart/batch", methods=["POST"])
+@login_required
+def batch_cart():
+    data = request.get_json(silent=True) or {}
+    try:
+        apply_batch(current_user.id, data.get("operations"))
+    except CartError as e:
+        db.session.rollback()
+        return jsonify(success=False, message=str(e)), 400
+    db.session.commit()
+    return jsonify(success=True, cart_items=cart_json(current_user.id))
+
 #  Stripe Payment Routes 
-@app.route("/payment")
+@bp.route("/payment")
 @login_required
 def payment():
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-    total = sum(item.product.price * item.quantity for item in cart_items)
-    return render_template("payment.html", cart_items=cart_items, total=total, stripe_key=STRIPE_PUBLISHABLE_KEY)
+    cart = load_cart(current_user.id)
+    return render_template("payment.html", cart_items=cart.lines, total=cart.total, stripe_key=current_app.config['STRIPE_PUBLISHABLE_KEY'])
 
-@app.route("/create-checkout-session", methods=["POST"])
+@bp.route("/create-checkout-session", methods=["POST"])
 @login_required
 def create_checkout_session():
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-    if not cart_items:
+    cart = load_cart(current_user.id)
+    if not cart:
         flash("Your cart is empty.", "danger")
-        return redirect(url_for("cart"))
-
-    line_items = [{
-        "price_data": {
-            "currency": "usd",
-            "product_data": {"name": item.product.product_name},
-            "unit_amount": int(item.product.price * 100),
-        },
-        "quantity": item.quantity,
-    } for item in cart_items]
+        return redirect(url_for("main.cart"))
 
     try:
-        session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=line_items,
-            mode='payment',
-            success_url=url_for('thank_you', _external=True),
-            cancel_url=url_for('payment', _external=True),
+        session = stripe_catalog.create_checkout_session(
+            cart,
+            # Stripe fills in the session id, which becomes the order's fulfillment key
+            success_url=url_for('main.thank_you', _external=True) + "?session_id={CHECKOUT_SESSION_ID}",
+            cancel_url=url_for('main.payment', _external=True),
         )
         return redirect(session.url, code=303)
-    except stripe.error.AuthenticationError:
+    except CheckoutUnavailable:
         flash("Stripe authentication failed. Check API key.", "danger")
-        return redirect(url_for("payment"))
+        return redirect(url_for("main.payment"))
 
-@app.route("/thank_you")
+@bp.route("/thank_you")
 @login_required
+@writes_db
 def thank_you():
-    # Grab file paths to email files to user
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-    file_paths = [item.product.file_path for item in cart_items]
-    send_email(current_user.email, file_paths)
-
-    # Cart total
-    purchased_items = [
-        {
-            "name": item.product.product_name,
-            "price": item.product.price,
-            "quantity": item.quantity,
-            "total": item.product.price * item.quantity,
-        }
-        for item in cart_items
-    ]
+    order_key = request.args.get("session_id") or f"user-{current_user.id}-{uuid.uuid4().hex}"
+    job = FulfillmentJob.query.filter_by(order_key=order_key).first()
+
+    if job is None:
+        cart = load_cart(current_user.id)
+        if not cart:
+            return render_template("thank_you.html", purchased_items=[])
+
+        # Cart total
+        purchased_items = [
+            {
+                "name": line.name,
+                "price": line.price,
+                "quantity": line.quantity,
+                "total": line.total,
+            }
+            for line in cart
+        ]
+
+        # Queue the files to be emailed and empty the cart in the same transaction
+        job = fulfillment_queue.enqueue(order_key, current_user.id, current_user.email, cart.file_paths, purchased_items)
+        clear_cart(current_user.id)
+        db.session.commit()
+        fulfillment_queue.notify()
+
+    if job.user_id != current_user.id:
+        abort(404)
+    downloads = []
+    if current_app.config['DELIVERY_MODE'] == 'links':
+        for path in job.file_paths:
+            url = download_url(path, current_user.id)
+            if url:
+                downloads.append({"name": os.path.basename(path), "url": url})
+    return render_template(
+        "thank_you.html",
+        purchased_items=job.items,
+        email=job.recipient,
+        order_key=job.order_key,
+        fulfillment_status=job.status,
+        downloads=downloads,
+    )
+
+@bp.route("/api/fulfillment/<order_key>")
+@login_required
+def fulfillment_status(order_key):
+    job = FulfillmentJob.query.filter_by(order_key=order_key, user_id=current_user.id).first()
+    if not job:
+        return jsonify(success=False), 404
+    return jsonify(success=True, status=job.status, attempts=job.attempts)
 
-    # Delete items from user's cart
-    CartItem.query.filter_by(user_id=current_user.id).delete()
-    db.session.commit()
-    return render_template("thank_you.html", purchased_items=purchased_items)
+# Signed download links for purchased files
+@bp.route("/download/<token>")
+def download(token):
+    file_path = read_download_token(token)
+    if file_path is None:
+        abort(404)
+    return send_download(file_path)
 
 # --- Run the App ---
 if __name__ == "__main__":
-    app.run(debug=True, host='0.0.0.0')
\ No newline at end of file
+    create_app().run(debug=True, host='0.0.0.0')
\ No newline at end of file
@@ -0,0 +1,164 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import click
+from flask import current_app, request, send_from_directory
+from flask.cli import AppGroup
+
+try:
+    import brotli
+except ImportError: # Brotli variants are skipped without the package
+    brotli = None
+
+# Fingerprinted static assets. `flask assets build` copies every static file to
+# static/dist under a content-hashed name, writes .gz/.br siblings for text
+# formats and records the mapping in static/dist/manifest.json. While a manifest
+# is present, url_for('static', ...) emits the hashed URL and those files are
+# served precompressed with a one-year immutable Cache-Control.
+
+DIST_FOLDER = "dist"
+MANIFEST_NAME = "manifest.json"
+
+# Paths relative to the static folder, at any depth. Purchased downloads go
+# out through signed links and are never fingerprinted, nor are images still
+# being staged by storage.py.
+EXCLUDED_FOLDERS = (DIST_FOLDER, "ebooks", "music", "product_images/blobs/.staging")
+EXCLUDED_NAMES = (".DS_Store",)
+
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".svg", ".json", ".txt", ".html", ".xml")
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Preferred first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _hashed_name(rel_path, digest):
+    root, ext = os.path.splitext(rel_path)
+    return f"{root}.{digest}{ext}"
+
+
+def _digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def _iter_assets(static_folder):
+    def relative(rel_root, name):
+        return os.path.normpath(os.path.join(rel_root, name)).replace(os.sep, "/")
+
+    for root, dirs, files in os.walk(static_folder):
+        rel_root = os.path.relpath(root, static_folder)
+        dirs[:] = [d for d in dirs if relative(rel_root, d) not in EXCLUDED_FOLDERS]
+        for name in files:
+            if name in EXCLUDED_NAMES:
+                continue
+            yield relative(rel_root, name)
+
+
+def _compress(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    with gzip.open(path + ".gz", "wb", compresslevel=9) as f:
+        f.write(data)
+    if brotli is not None:
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(data, quality=11))
+
+
+def build_assets(static_folder):
+    """Writes the fingerprinted, precompressed copies and returns the manifest."""
+    dist = os.path.join(static_folder, DIST_FOLDER)
+    manifest = {}
+    for rel_path in _iter_assets(static_folder):
+        source = os.path.join(static_folder, rel_path)
+        hashed = _hashed_name(rel_path, _digest(source))
+        target = os.path.join(dist, hashed)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(source, target)
+            if rel_path.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+                _compress(target)
+        manifest[rel_path] = f"{DIST_FOLDER}/{hashed}"
+
+    manifest_path = os.path.join(dist, MANIFEST_NAME)
+    os.makedirs(dist, exist_ok=True)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return manifest
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST_FOLDER, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class StaticAssets:
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.hashed = frozenset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.reload(app.static_folder)
+        app.url_defaults(self._hashed_static_url)
+        app.view_functions["static"] = self._send_static
+        app.extensions["static_assets"] = self
+        app.cli.add_command(assets_cli)
+
+    def reload(self, static_folder):
+        self.manifest = load_manifest(static_folder)
+        self.hashed = frozenset(self.manifest.values())
+
+    def _hashed_static_url(self, endpoint, values):
+        if endpoint != "static" or not self.manifest:
+            return
+        filename = values.get("filename", "").lstrip("/")
+        hashed = self.manifest.get(filename)
+        if hashed:
+            values["filename"] = hashed
+
+    def _send_static(self, filename):
+        if filename not in self.hashed:
+            return current_app.send_static_file(filename)
+
+        static_folder = current_app.static_folder
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        served, encoding = filename, None
+        accepted = request.accept_encodings
+        for name, suffix in ENCODINGS:
+            if accepted[name] and os.path.exists(os.path.join(static_folder, filename + suffix)):
+                served, encoding = filename + suffix, name
+                break
+
+        response = send_from_directory(static_folder, served, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        response.vary.add("Accept-Encoding")
+        if encoding:
+            response.content_encoding = encoding
+        return response
+
+
+static_assets = StaticAssets()
+
+assets_cli = AppGroup("assets", help="Fingerprinted static assets.")
+
+
+@assets_cli.command("build")
+def build_command():
+    """Fingerprints and precompresses everything under static/."""
+    manifest = build_assets(current_app.static_folder)
+    static_assets.reload(current_app.static_folder)
+    click.echo(f"Fingerprinted {len(manifest)} asset(s).")
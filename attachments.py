@@ -0,0 +1,149 @@
+import base64
+import functools
+import hashlib
+import mimetypes
+import os
+import tempfile
+import threading
+from cache import LRUCache
+
+# Prepares Mailjet attachments. Files are base64-encoded a chunk at a time, and
+# the encoded payloads are cached in memory and on disk keyed by path, mtime and
+# size, so repeat purchases of the same product skip the read and the encode.
+# The disk cache has one slot per source file, so a changed file replaces its
+# old payload, and it is pruned least recently used first once it grows past
+# ATTACHMENT_CACHE_DISK_BYTES.
+
+# A multiple of 3 bytes, so every chunk encodes without padding and the pieces
+# concatenate into one valid base64 string
+CHUNK_SIZE = 3 * 64 * 1024
+
+
+@functools.lru_cache(maxsize=1024)
+def guess_content_type(filename):
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+def encode_file(path, chunk_size=CHUNK_SIZE):
+    """Base64-encodes a file without holding its raw bytes in memory all at once."""
+    parts = []
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            parts.append(base64.b64encode(chunk).decode("ascii"))
+    return "".join(parts)
+
+
+class AttachmentCache:
+    def __init__(self, app=None):
+        self.memory = LRUCache(0)
+        self.directory = None
+        self.disk_bytes = 0
+        self._disk_used = None # Bytes on disk, counted on first write
+        self._disk_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("ATTACHMENT_CACHE_BYTES", 64 * 1024 * 1024)
+        # Encoded payloads survive restarts here; set to None to keep them in memory only
+        app.config.setdefault("ATTACHMENT_CACHE_DIR", os.path.join(app.instance_path, "attachment_cache"))
+        app.config.setdefault("ATTACHMENT_CACHE_DISK_BYTES", 512 * 1024 * 1024)
+        self.memory = LRUCache(app.config["ATTACHMENT_CACHE_BYTES"], sizeof=len)
+        self.directory = app.config["ATTACHMENT_CACHE_DIR"]
+        self.disk_bytes = app.config["ATTACHMENT_CACHE_DISK_BYTES"]
+        self._disk_used = None
+        app.extensions["attachment_cache"] = self
+
+    def _disk_path(self, path):
+        digest = hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + ".b64")
+
+    def _read_disk(self, path, version):
+        disk_path = self._disk_path(path)
+        try:
+            with open(disk_path, "r", encoding="ascii") as f:
+                if f.readline().rstrip("\n") != version:
+                    return None # Encoded from an older copy of the file
+                encoded = f.read()
+            os.utime(disk_path) # Marks it recently used for pruning
+            return encoded
+        except OSError:
+            return None
+
+    def _write_disk(self, path, version, encoded):
+        disk_path = self._disk_path(path)
+        os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+        # Write then rename so concurrent readers never see a partial payload
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(disk_path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="ascii") as f:
+                f.write(version + "\n")
+                f.write(encoded)
+            replaced = os.path.getsize(disk_path) if os.path.exists(disk_path) else 0
+            os.replace(tmp_path, disk_path)
+        except OSError:
+            os.unlink(tmp_path)
+            return
+        self._account(len(version) + 1 + len(encoded) - replaced)
+
+    def _entries(self):
+        """Yields (last used, size, path) of every payload on disk."""
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                full = os.path.join(root, name)
+                try:
+                    stat = os.stat(full)
+                except OSError:
+                    continue
+                yield stat.st_mtime, stat.st_size, full
+
+    def _account(self, delta):
+        with self._disk_lock:
+            if self._disk_used is None:
+                self._disk_used = sum(size for _, size, _ in self._entries())
+            else:
+                self._disk_used += delta
+            if self._disk_used > self.disk_bytes:
+                self._prune()
+
+    def _prune(self):
+        # Other processes share the directory, so recount before deciding what to drop
+        entries = sorted(self._entries())
+        used = sum(size for _, size, _ in entries)
+        target = self.disk_bytes * 0.9 # Some headroom so the next writes don't prune again
+        for _, size, full in entries:
+            if used <= target:
+                break
+            try:
+                os.remove(full)
+            except OSError:
+                continue
+            used -= size
+        self._disk_used = used
+
+    def encoded(self, path):
+        """Returns the base64 payload of `path`, reusing a cached copy if the file is unchanged."""
+        stat = os.stat(path)
+        version = f"{stat.st_mtime_ns}:{stat.st_size}"
+        key = f"{os.path.abspath(path)}:{version}"
+        encoded = self.memory.get(key)
+        if encoded is None and self.directory:
+            encoded = self._read_disk(path, version)
+        if encoded is None:
+            encoded = encode_file(path)
+            if self.directory:
+                self._write_disk(path, version, encoded)
+        self.memory.set(key, encoded)
+        return encoded
+
+    def attachment(self, path):
+        """Returns a Mailjet attachment dict for `path`."""
+        filename = os.path.basename(path)
+        return {
+            "ContentType": guess_content_type(filename),
+            "Filename": filename,
+            "Base64Content": self.encoded(path),
+        }
+
+
+attachment_cache = AttachmentCache()
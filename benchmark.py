@@ -0,0 +1,350 @@
+"""Latency benchmark for the storefront routes.
+
+Seeds a synthetic catalog into a throwaway SQLite database, drives the routes
+through the Flask test client with Stripe and Mailjet stubbed out, and reports
+p50/p95/p99 latency, throughput and SQL statements per route. Results are
+written as JSON and can be compared against an earlier run:
+
+    python benchmark.py --products 5000 --output before.json
+    python benchmark.py --products 5000 --baseline before.json
+
+Runs with the same options and --seed issue the same requests against the
+same data, so only compare results of identical runs. The exit status is 1 when a route's
+p95 regresses by more than --threshold or it issues more SQL than the baseline.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+CATEGORIES = ("art", "pdfs", "ebooks", "egiftcards", "music")
+
+WORDS = (
+    "vintage", "digital", "poster", "icon", "wallpaper", "novel", "guide", "album",
+    "gift", "card", "sketch", "pattern", "planner", "recipe", "beat", "loop",
+    "portrait", "landscape", "journal", "template", "font", "brush", "mystery", "jazz",
+)
+
+PERCENTILES = (50, 95, 99)
+
+
+class StubStripeClient:
+    """Answers the two Stripe calls the app makes without touching the network."""
+
+    def __init__(self):
+        self.prices = SimpleNamespace(create=self._create_price)
+        self.checkout = SimpleNamespace(sessions=SimpleNamespace(create=self._create_session))
+        self._ids = 0
+
+    def _next_id(self, prefix):
+        self._ids += 1
+        return f"{prefix}_bench_{self._ids}"
+
+    def _create_price(self, params=None, options=None):
+        return SimpleNamespace(id=self._next_id("price"))
+
+    def _create_session(self, params=None, options=None):
+        session_id = self._next_id("cs")
+        url = params["success_url"].replace("{CHECKOUT_SESSION_ID}", session_id)
+        return SimpleNamespace(id=session_id, url=url)
+
+
+class Recorder:
+    """Collects wall-clock timings and SQL statement counts per route."""
+
+    def __init__(self):
+        self.timings = {}
+        self.statements = {}
+        self.errors = {}
+        self.enabled = True
+        self._sql = 0
+
+    def count_sql(self, *args):
+        self._sql += 1
+
+    def request(self, route, call, *args, **kwargs):
+        sql_before = self._sql
+        start = time.perf_counter()
+        response = call(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        if self.enabled:
+            self.timings.setdefault(route, []).append(elapsed)
+            self.statements.setdefault(route, []).append(self._sql - sql_before)
+            if response.status_code >= 400:
+                self.errors[route] = self.errors.get(route, 0) + 1
+        return response
+
+
+def percentile(sorted_values, pct):
+    # Nearest-rank, so the reported value is always an observed one
+    index = max(0, -(-pct * len(sorted_values) // 100) - 1)
+    return sorted_values[index]
+
+
+def summarize(recorder):
+    routes = {}
+    for route, timings in recorder.timings.items():
+        ordered = sorted(timings)
+        statements = recorder.statements[route]
+        summary = {"requests": len(timings)}
+        for pct in PERCENTILES:
+            summary[f"p{pct}_ms"] = round(percentile(ordered, pct) * 1000, 3)
+        summary["mean_ms"] = round(sum(timings) / len(timings) * 1000, 3)
+        summary["throughput_rps"] = round(len(timings) / sum(timings), 1)
+        summary["sql_per_request"] = round(sum(statements) / len(statements), 2)
+        summary["sql_max"] = max(statements)
+        summary["errors"] = recorder.errors.get(route, 0)
+        routes[route] = summary
+    return routes
+
+
+def build_app(workdir):
+    from app import create_app, create_sample_products
+    from models import db
+    from search import ensure_search_index
+    from stripe_catalog import stripe_catalog
+
+    os.environ.pop("DATABASE_READ_URL", None)
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(workdir, 'benchmark.db')}",
+        "DELIVERY_MODE": "links",
+        "MAIL_BACKEND": "local",
+        "FULFILLMENT_TRANSPORT": "local",
+        # Deliveries stay queued; background workers would compete for the write lock
+        "FULFILLMENT_WORKERS": 0,
+    })
+    stripe_catalog._client = StubStripeClient()
+    with app.app_context():
+        db.create_all()
+        ensure_search_index()
+        create_sample_products()
+    return app
+
+
+def close_app(app):
+    from models import db
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def seed(app, rng, products, users, max_cart):
+    from passwords import password_hasher
+    from models import db, User, Product, CartItem
+
+    with app.app_context():
+        # One hash for everyone: bcrypt cost is not what this benchmark measures
+        password_hash = password_hasher.hash("benchmark")
+        db.session.execute(db.insert(User), [
+            {"username": f"bench{i}", "email": f"bench{i}@example.com", "password_hash": password_hash}
+            for i in range(users)
+        ])
+        user_ids = db.session.scalars(db.select(User.id).where(User.username.startswith("bench"))).all()
+
+        rows = []
+        for i in range(products):
+            name = " ".join(rng.sample(WORDS, 3)).title()
+            rows.append({
+                "product_name": f"{name} {i}",
+                "description": " ".join(rng.choices(WORDS, k=rng.randint(20, 80))),
+                "price": round(rng.uniform(0.99, 99.99), 2),
+                "image_path": "product_images/cat_icons.png",
+                "file_path": f"ebooks/bench-{i}.pdf",
+                "category": rng.choice(CATEGORIES),
+                "user_id": rng.choice(user_ids),
+            })
+        db.session.execute(db.insert(Product), rows)
+        product_ids = db.session.scalars(db.select(Product.id)).all()
+
+        items = []
+        for user_id in user_ids:
+            for product_id in rng.sample(product_ids, rng.randint(0, max_cart)):
+                items.append({"user_id": user_id, "product_id": product_id, "quantity": rng.randint(1, 3)})
+        if items:
+            db.session.execute(db.insert(CartItem), items)
+        # Bulk inserts skip the ORM flush hook that maintains the facets
+        from facets import rebuild_facets
+        rebuild_facets(db.session.connection())
+        db.session.commit()
+
+        from featured import featured_products
+        featured_products.refresh()
+        return user_ids, product_ids
+
+
+def logged_in_client(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user_id)
+        session["_fresh"] = True
+    return client
+
+
+def run_scenarios(app, recorder, rng, user_ids, product_ids, iterations):
+    anonymous = app.test_client()
+    clients = {user_id: logged_in_client(app, user_id) for user_id in user_ids}
+
+    for _ in range(iterations):
+        recorder.request("home", anonymous.get, "/")
+        recorder.request("product", anonymous.get, f"/product/{rng.choice(product_ids)}")
+
+        category = rng.choice(CATEGORIES)
+        response = recorder.request("category", anonymous.get, f"/category/{category}")
+        next_link = response.headers.get("Link")
+        if next_link:
+            recorder.request("category_next_page", anonymous.get, next_link[1:next_link.index(">")])
+        low = rng.choice((0, 5, 10, 25))
+        prices = {"min_price": low, "max_price": low + rng.choice((15, 35))}
+        recorder.request("category_price", anonymous.get, f"/category/{category}", query_string=prices)
+        recorder.request("facets", anonymous.get, "/api/facets", query_string=dict(prices, category=category))
+
+        query = " ".join(rng.sample(WORDS, rng.randint(1, 2)))
+        recorder.request("search", anonymous.get, "/api/search", query_string={"q": query})
+        recorder.request("search_prefix", anonymous.get, "/api/search", query_string={"q": rng.choice(WORDS)[:3]})
+
+        user_id = rng.choice(user_ids)
+        client = clients[user_id]
+        response = recorder.request("cart_get", client.get, "/api/cart")
+
+        # Add, update and remove a product that isn't in the cart yet, so carts keep their seeded contents
+        in_cart = {line["product_id"] for line in response.get_json()["cart_items"]}
+        product_id = rng.choice(product_ids)
+        while product_id in in_cart:
+            product_id = rng.choice(product_ids)
+        recorder.request("cart_add", client.post, "/api/cart/add", json={"product_id": product_id})
+        cart = client.get("/api/cart").get_json()
+        item_id = next(line["id"] for line in cart["cart_items"] if line["product_id"] == product_id)
+        recorder.request("cart_update", client.post, f"/api/cart/update/{item_id}", json={"quantity": 2})
+        recorder.request("cart_remove", client.delete, f"/api/cart/remove/{item_id}")
+
+        # Checkout empties the cart, so it runs as a throwaway buyer refilled through the batch endpoint
+        buyer = clients[rng.choice(user_ids)]
+        operations = [{"op": "add", "product_id": pid} for pid in rng.sample(product_ids, rng.randint(1, 5))]
+        recorder.request("cart_batch", buyer.post, "/api/cart/batch", json={"operations": operations})
+        recorder.request("payment", buyer.get, "/payment")
+        response = recorder.request("checkout", buyer.post, "/create-checkout-session")
+        recorder.request("thank_you", buyer.get, response.headers["Location"])
+
+
+def install_sql_counter(app, recorder):
+    from sqlalchemy import event
+    from models import db
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, "before_cursor_execute", recorder.count_sql)
+
+
+def compare(results, baseline, threshold):
+    """Prints the change against `baseline`; returns the routes that regressed."""
+    regressions = []
+    print(f"\n{'route':<20} {'p95 base':>10} {'p95 now':>10} {'change':>8} {'sql base':>9} {'sql now':>8}")
+    for route, now in results["routes"].items():
+        before = baseline["routes"].get(route)
+        if before is None:
+            print(f"{route:<20} {'-':>10} {now['p95_ms']:>10.2f} {'new':>8}")
+            continue
+        change = (now["p95_ms"] - before["p95_ms"]) / before["p95_ms"] if before["p95_ms"] else 0.0
+        flag = ""
+        if change > threshold or now["sql_per_request"] > before["sql_per_request"]:
+            regressions.append(route)
+            flag = "  <-- regression"
+        print(
+            f"{route:<20} {before['p95_ms']:>10.2f} {now['p95_ms']:>10.2f} {change:>+8.1%} "
+            f"{before['sql_per_request']:>9.2f} {now['sql_per_request']:>8.2f}{flag}"
+        )
+    return regressions
+
+
+def print_report(results):
+    print(f"{'route':<20} {'reqs':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'sql':>6} {'errors':>6}")
+    for route, summary in results["routes"].items():
+        print(
+            f"{route:<20} {summary['requests']:>6} {summary['p50_ms']:>8.2f} {summary['p95_ms']:>8.2f} "
+            f"{summary['p99_ms']:>8.2f} {summary['throughput_rps']:>8.1f} {summary['sql_per_request']:>6.1f} "
+            f"{summary['errors']:>6}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=2000, help="Synthetic products to seed.")
+    parser.add_argument("--users", type=int, default=50, help="Synthetic users to seed.")
+    parser.add_argument("--max-cart", type=int, default=10, help="Largest seeded cart.")
+    parser.add_argument("--iterations", type=int, default=200, help="Timed passes over every route.")
+    parser.add_argument("--warmup", type=int, default=20, help="Untimed passes run first.")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for data and request mix.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--baseline", help="Compare against the JSON results of an earlier run.")
+    parser.add_argument("--threshold", type=float, default=0.20, help="Allowed p95 slowdown against the baseline.")
+    args = parser.parse_args(argv)
+
+    # The seeded database is thrown away with its directory when the run ends
+    with tempfile.TemporaryDirectory(prefix="bytemarket-bench-") as workdir:
+        app = build_app(workdir)
+        try:
+            return run_benchmark(app, args, workdir)
+        finally:
+            close_app(app)
+
+
+def run_benchmark(app, args, workdir):
+    rng = random.Random(args.seed)
+    random.seed(args.seed) # The featured products rotation samples from the global generator
+    started = time.perf_counter()
+    user_ids, product_ids = seed(app, rng, args.products, args.users, args.max_cart)
+    print(f"Seeded {len(product_ids)} products and {len(user_ids)} users in {time.perf_counter() - started:.1f}s ({workdir})")
+
+    recorder = Recorder()
+    install_sql_counter(app, recorder)
+    recorder.enabled = False
+    run_scenarios(app, recorder, rng, user_ids, product_ids, args.warmup)
+    recorder.enabled = True
+    started = time.perf_counter()
+    run_scenarios(app, recorder, rng, user_ids, product_ids, args.iterations)
+    elapsed = time.perf_counter() - started
+
+    results = {
+        "meta": {
+            "products": len(product_ids),
+            "users": len(user_ids),
+            "max_cart": args.max_cart,
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "total_requests": sum(len(t) for t in recorder.timings.values()),
+            "throughput_rps": round(sum(len(t) for t in recorder.timings.values()) / elapsed, 1),
+        },
+        "routes": summarize(recorder),
+    }
+    print_report(results)
+    print(f"\n{results['meta']['total_requests']} requests in {elapsed:.1f}s ({results['meta']['throughput_rps']} req/s)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressed: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+import csv
+import io
+import json
+import math
+import multiprocessing
+import os
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from models import db, Product, User
+from cache import catalog_cache
+from featured import featured_products
+from http_cache import http_cache
+from suggest import suggestion_index
+from storage import blob_store
+import images
+
+# Bulk product import for sellers. A manifest (CSV with a header row, or JSON
+# Lines) names one product per row, and a zip archive carries the images and
+# purchasable files it refers to. Rows are read and validated one at a time,
+# valid ones are gathered into batches of IMPORT_BATCH_SIZE, and each batch
+# has its members staged in the blob store and its images processed in a pool
+# of IMPORT_IMAGE_WORKERS processes, all without a database transaction. Only
+# then are the blob references taken and the products inserted, in one short
+# transaction per batch, so the write lock is never held while images are
+# processed. Only the current batch is held in memory, so a manifest of any
+# length imports in flat memory; errors are reported per row as they occur.
+# Stripe prices are not created here: checkout falls back to inline prices
+# until `flask stripe-sync` runs.
+
+MANIFEST_FIELDS = ("product_name", "description", "price", "category", "image", "file")
+
+# The same formats ProductForm accepts
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+FILE_EXTENSIONS = (".pdf", ".epub", ".mobi", ".mp3", ".wav", ".flac", ".ogg", ".m4a", ".zip", ".txt")
+
+
+@dataclass(frozen=True)
+class RowError:
+    row: int
+    errors: tuple
+
+
+@dataclass
+class ImportSummary:
+    imported: int = 0
+    failed: int = 0
+
+
+def read_manifest(stream, format):
+    """Yields (row number, dict) for each manifest row without reading ahead."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if format == "csv":
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield number, record if isinstance(record, dict) else None
+
+
+def manifest_format(filename):
+    return "csv" if filename.lower().endswith(".csv") else "jsonl"
+
+
+def _member(archive, name, max_bytes, errors, label):
+    try:
+        info = archive.getinfo(name)
+    except KeyError:
+        errors.append(f"{label} {name!r} is not in the archive")
+        return None
+    if info.is_dir() or info.file_size > max_bytes:
+        errors.append(f"{label} {name!r} is not a file under {max_bytes} bytes")
+        return None
+    return info
+
+
+def validate_row(record, archive, max_bytes):
+    """Returns (values, errors) for one manifest row, applying ProductForm's rules."""
+    if record is None:
+        return None, ["Not a JSON object"]
+    values = {name: str(record.get(name) or "").strip() for name in MANIFEST_FIELDS}
+    errors = []
+    if not values["product_name"] or len(values["product_name"]) > 200:
+        errors.append("product_name is required and at most 200 characters")
+    if not values["description"]:
+        errors.append("description is required")
+    if not values["category"] or len(values["category"]) > 255:
+        errors.append("category is required and at most 255 characters")
+    try:
+        values["price"] = float(values["price"])
+        if not math.isfinite(values["price"]) or values["price"] <= 0:
+            raise ValueError
+    except ValueError:
+        errors.append("price must be a positive number")
+
+    if not values["image"].lower().endswith(IMAGE_EXTENSIONS):
+        errors.append("image must be a .jpg, .jpeg or .png in the archive")
+    else:
+        values["image"] = _member(archive, values["image"], max_bytes, errors, "image")
+    if not values["file"].lower().endswith(FILE_EXTENSIONS):
+        errors.append(f"file must be one of {', '.join(FILE_EXTENSIONS)} in the archive")
+    else:
+        values["file"] = _member(archive, values["file"], max_bytes, errors, "file")
+    return values, errors
+
+
+def _stage(archive, info, kind):
+    with archive.open(info) as source:
+        return blob_store.stage(source, os.path.basename(info.filename), kind)
+
+
+def _process_image_job(job):
+    # Top-level so ProcessPoolExecutor can pickle it
+    static_folder, image_path, source = job
+    try:
+        return images.process_image(static_folder, image_path, source), None
+    except Exception as e:
+        return None, str(e)
+
+
+class _Pool:
+    """Runs image jobs in worker processes, or inline with 0 workers."""
+
+    def __init__(self, workers):
+        # spawn, because forking a threaded web worker can copy held locks
+        context = multiprocessing.get_context("spawn")
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=context) if workers else None
+
+    def map(self, jobs):
+        if self._executor is None:
+            return map(_process_image_job, jobs)
+        return self._executor.map(_process_image_job, jobs)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+
+def _import_batch(batch, archive, seller_id, pool, summary):
+    """Stages, processes and inserts one batch; yields a RowError for each row that fails."""
+    static_folder = current_app.static_folder
+    staged = []
+    for number, values in batch:
+        image = download = None
+        try:
+            image = _stage(archive, values["image"], "image")
+            download = _stage(archive, values["file"], "file")
+        except (OSError, zipfile.BadZipFile) as e:
+            blob_store.discard(image)
+            summary.failed += 1
+            yield RowError(number, (f"Could not extract: {e}",))
+            continue
+        staged.append((number, values, image, download))
+
+    ready = []
+    jobs = [(static_folder, image.path, image.staged) for _, _, image, _ in staged]
+    for (number, values, image, download), (variants, error) in zip(staged, pool.map(jobs)):
+        if error:
+            blob_store.discard(image)
+            blob_store.discard(download)
+            summary.failed += 1
+            yield RowError(number, (f"Unreadable image: {error}",))
+            continue
+        ready.append((values, image, download, variants))
+    if not ready:
+        return
+
+    # The batch's only write transaction
+    products = []
+    try:
+        for values, image, download, variants in ready:
+            stored_image = blob_store.commit(image)
+            stored_download = blob_store.commit(download)
+            products.append(Product(
+                product_name=values["product_name"],
+                description=values["description"],
+                price=values["price"],
+                category=values["category"],
+                image_path=stored_image.path,
+                image_variants=variants,
+                file_path=stored_download.path,
+                file_size=stored_download.size,
+                user_id=seller_id,
+            ))
+        db.session.add_all(products)
+        http_cache.bump_catalog_version()
+        db.session.commit()
+    except BaseException:
+        # Files already moved into place are left for `flask storage gc`
+        db.session.rollback()
+        for _, image, download, _ in ready:
+            blob_store.discard(image)
+            blob_store.discard(download)
+        raise
+    summary.imported += len(products)
+
+
+def run_import(manifest, format, archive, seller_id, batch_size=None, workers=None):
+    """Imports a manifest for `seller_id`, yielding a RowError per failed row and the ImportSummary last.
+
+    `manifest` is a binary stream and `archive` an open zipfile.ZipFile; the
+    caller closes both.
+    """
+    config = current_app.config
+    batch_size = batch_size or config["IMPORT_BATCH_SIZE"]
+    workers = config["IMPORT_IMAGE_WORKERS"] if workers is None else workers
+    max_bytes = config["IMPORT_MAX_FILE_BYTES"]
+    summary = ImportSummary()
+
+    pool = _Pool(workers)
+    try:
+        batch = []
+        for number, record in read_manifest(manifest, format):
+            values, errors = validate_row(record, archive, max_bytes)
+            if errors:
+                summary.failed += 1
+                yield RowError(number, tuple(errors))
+                continue
+            batch.append((number, values))
+            if len(batch) >= batch_size:
+                yield from _import_batch(batch, archive, seller_id, pool, summary)
+                batch = []
+        if batch:
+            yield from _import_batch(batch, archive, seller_id, pool, summary)
+    finally:
+        pool.close()
+        if summary.imported:
+            # One reload beats updating the in-memory indexes product by product
+            catalog_cache.clear()
+            featured_products.refresh()
+            suggestion_index.refresh()
+    yield summary
+
+
+@click.command("import-products")
+@click.argument("manifest", type=click.Path(exists=True, dir_okay=False))
+@click.argument("archive", type=click.Path(exists=True, dir_okay=False))
+@click.option("--seller", required=True, help="Email of the seller who owns the products.")
+@click.option("--format", "format", type=click.Choice(["csv", "jsonl"]), help="Manifest format; guessed from the extension.")
+@click.option("--batch-size", type=int, help="Rows per transaction (default IMPORT_BATCH_SIZE).")
+@click.option("--workers", type=int, help="Image worker processes (default IMPORT_IMAGE_WORKERS).")
+@with_appcontext
+def import_products_command(manifest, archive, seller, format, batch_size, workers):
+    """Imports products from a CSV/JSONL manifest and a zip of their images and files."""
+    user = User.query.filter_by(email=seller).first()
+    if user is None or user.role not in ("seller", "admin"):
+        raise click.ClickException(f"{seller} is not a seller.")
+    try:
+        zip_archive = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise click.ClickException(f"{archive} is not a zip file.")
+    with open(manifest, "rb") as manifest_file, zip_archive:
+        for event in run_import(manifest_file, format or manifest_format(manifest), zip_archive, user.id, batch_size, workers):
+            if isinstance(event, RowError):
+                click.echo(f"Row {event.row}: {'; '.join(event.errors)}", err=True)
+            else:
+                click.echo(f"Imported {event.imported} product(s), {event.failed} row(s) failed.")
+                if event.failed:
+                    sys.exit(1)
+
+
+def init_app(app):
+    app.config.setdefault("IMPORT_BATCH_SIZE", 200)
+    app.config.setdefault("IMPORT_IMAGE_WORKERS", min(4, os.cpu_count() or 1))
+    app.config.setdefault("IMPORT_MAX_FILE_BYTES", 512 * 1024 * 1024) # Per archive member, checked before extracting
+    app.cli.add_command(import_products_command)
@@ -0,0 +1,300 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from types import MappingProxyType
+from typing import Mapping
+from flask import has_request_context, session
+from flask_login import UserMixin, user_logged_out
+from models import db, Product, User
+from listings import PAGE_SIZE, category_page
+from metrics import REGISTRY, stats_gauges
+
+# In-process caches for read-mostly data
+
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional time-to-live per entry.
+
+    By default `maxsize` counts entries; pass `sizeof` to bound the total weight
+    of the values instead (e.g. `sizeof=len` for a byte budget).
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic, sizeof=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._sizeof = sizeof or (lambda value: 1)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires, _ = entry
+                if expires is None or expires > self._clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        expires = self._clock() + self.ttl if self.ttl else None
+        size = self._sizeof(value)
+        if size > self.maxsize:
+            return
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (value, expires, size)
+            self.weight += size
+            while self.weight > self.maxsize:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[2]
+        return entry
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._remove(key)
+        return entry[0] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "weight": self.weight,
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def _frozen_variants(variants):
+    # Read-only copies, so a snapshot never shares the row's mutable JSON
+    if variants is None:
+        return None
+    return MappingProxyType({size: MappingProxyType(dict(paths)) for size, paths in variants.items()})
+
+
+@dataclass(frozen=True)
+class ProductSnapshot:
+    """Immutable copy of a Product row that is safe to share between requests."""
+    id: int
+    product_name: str
+    description: str
+    price: float
+    image_path: str
+    image_variants: Mapping | None
+    file_path: str
+    category: str
+    user_id: int
+    updated_at: datetime
+
+    @classmethod
+    def from_product(cls, product):
+        return cls(
+            id=product.id,
+            product_name=product.product_name,
+            description=product.description,
+            price=product.price,
+            image_path=product.image_path,
+            image_variants=_frozen_variants(product.image_variants),
+            file_path=product.file_path,
+            category=product.category,
+            user_id=product.user_id,
+            updated_at=product.updated_at,
+        )
+
+
+class CatalogCache:
+    """Caches product snapshots by id and the first listing page of each category.
+
+    Entries are evicted LRU-first and after CATALOG_CACHE_TTL seconds; writers
+    must call `invalidate()` after committing a product insert or edit.
+    """
+
+    def __init__(self, app=None):
+        self.products = LRUCache()
+        self.categories = LRUCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("CATALOG_CACHE_SIZE", 1024)
+        app.config.setdefault("CATALOG_CACHE_CATEGORIES", 64)
+        app.config.setdefault("CATALOG_CACHE_TTL", 300)
+        ttl = app.config["CATALOG_CACHE_TTL"]
+        self.products = LRUCache(app.config["CATALOG_CACHE_SIZE"], ttl)
+        self.categories = LRUCache(app.config["CATALOG_CACHE_CATEGORIES"], ttl)
+        app.extensions["catalog_cache"] = self
+
+    def get_product(self, product_id):
+        """Returns the snapshot for `product_id`, or None if there is no such product."""
+        snapshot = self.products.get(product_id)
+        if snapshot is None:
+            product = db.session.get(Product, product_id)
+            if product is None:
+                return None
+            snapshot = ProductSnapshot.from_product(product)
+            self.products.set(product_id, snapshot)
+        return snapshot
+
+    def get_products(self, product_ids):
+        """Returns the snapshots for `product_ids` in order, skipping ids with no product.
+
+        Misses are loaded together in one query rather than one per id.
+        """
+        snapshots = {product_id: self.products.get(product_id) for product_id in product_ids}
+        missing = [product_id for product_id, snapshot in snapshots.items() if snapshot is None]
+        if missing:
+            for product in db.session.scalars(db.select(Product).where(Product.id.in_(missing))):
+                snapshot = ProductSnapshot.from_product(product)
+                self.products.set(product.id, snapshot)
+                snapshots[product.id] = snapshot
+        return [snapshots[product_id] for product_id in product_ids if snapshots[product_id] is not None]
+
+    def get_category_page(self, category_name, cursor=None, limit=PAGE_SIZE):
+        """Returns a listings.Page of `category_name`.
+
+        Only the default-sized first page is cached; later pages are cheap
+        index range reads and are fetched on demand.
+        """
+        if cursor or limit != PAGE_SIZE:
+            return category_page(category_name, cursor, limit)
+        page = self.categories.get(category_name)
+        if page is None:
+            page = category_page(category_name)
+            self.categories.set(category_name, page)
+        return page
+
+    def invalidate(self, product):
+        """Drops everything that may hold a stale copy of `product`."""
+        cached = self.products.pop(product.id)
+        self.categories.pop(product.category)
+        if cached is not None and cached.category != product.category:
+            self.categories.pop(cached.category)
+
+    def clear(self):
+        self.products.clear()
+        self.categories.clear()
+
+    def stats(self):
+        return {"products": self.products.stats(), "categories": self.categories.stats()}
+
+
+@dataclass(frozen=True)
+class UserSnapshot(UserMixin):
+    """What authenticated requests need to know about the logged-in user.
+
+    Views that change the account load the User row itself.
+    """
+    id: int
+    username: str
+    email: str
+    role: str
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(id=user.id, username=user.username, email=user.email, role=user.role)
+
+
+class UserCache:
+    """Backs Flask-Login's user_loader with cached user snapshots.
+
+    Snapshots live in a per-process LRU for USER_CACHE_TTL seconds. With
+    SESSION_IDENTITY on, the snapshot is also stored in the (signed) session
+    cookie and trusted for SESSION_IDENTITY_MAX_AGE seconds, so most requests
+    don't touch the cache or the database at all. Call `invalidate()` after
+    committing a change to a user; other processes see it when the TTLs lapse.
+    """
+
+    # Bump when UserSnapshot changes shape so old cookies are ignored
+    IDENTITY_VERSION = 1
+    SESSION_KEY = "_identity"
+
+    def __init__(self, app=None):
+        self.users = LRUCache()
+        self.session_identity = False
+        self.identity_max_age = 300
+        self._revoked = LRUCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("USER_CACHE_SIZE", 4096)
+        app.config.setdefault("USER_CACHE_TTL", 60)
+        app.config.setdefault("SESSION_IDENTITY", False)
+        app.config.setdefault("SESSION_IDENTITY_MAX_AGE", 300)
+        self.users = LRUCache(app.config["USER_CACHE_SIZE"], app.config["USER_CACHE_TTL"])
+        self.session_identity = app.config["SESSION_IDENTITY"]
+        self.identity_max_age = app.config["SESSION_IDENTITY_MAX_AGE"]
+        # Invalidation times, remembered as long as an identity issued before them could still be accepted
+        self._revoked = LRUCache(app.config["USER_CACHE_SIZE"], self.identity_max_age)
+        user_logged_out.connect(self._forget_identity, app)
+        app.extensions["user_cache"] = self
+
+    def load(self, user_id):
+        """Returns the UserSnapshot for `user_id`, or None if there is no such user."""
+        if self.session_identity and has_request_context():
+            snapshot = self._identity_from_session(user_id)
+            if snapshot is not None:
+                return snapshot
+
+        snapshot = self.users.get(user_id)
+        if snapshot is None:
+            user = db.session.get(User, user_id)
+            if user is None:
+                return None
+            snapshot = UserSnapshot.from_user(user)
+            self.users.set(user_id, snapshot)
+
+        if self.session_identity and has_request_context():
+            session[self.SESSION_KEY] = dict(asdict(snapshot), v=self.IDENTITY_VERSION, iat=time.time())
+        return snapshot
+
+    def _identity_from_session(self, user_id):
+        identity = session.get(self.SESSION_KEY)
+        if not isinstance(identity, dict) or identity.get("v") != self.IDENTITY_VERSION or identity.get("id") != user_id:
+            return None
+        issued = identity.get("iat", 0)
+        if time.time() - issued > self.identity_max_age or issued <= self._revoked.get(user_id, 0):
+            return None
+        return UserSnapshot(id=user_id, username=identity["username"], email=identity["email"], role=identity["role"])
+
+    def _forget_identity(self, sender, **extra):
+        session.pop(self.SESSION_KEY, None)
+
+    def invalidate(self, user_id):
+        self.users.pop(user_id)
+        self._revoked.set(user_id, time.time())
+        if has_request_context():
+            session.pop(self.SESSION_KEY, None)
+
+    def stats(self):
+        return {"users": self.users.stats()}
+
+
+catalog_cache = CatalogCache()
+user_cache = UserCache()
+REGISTRY.add_collector(lambda: stats_gauges("bytemarket_catalog_cache", "Catalog cache counters.", catalog_cache.stats(), label="cache"))
+REGISTRY.add_collector(lambda: stats_gauges("bytemarket_user_cache", "User cache counters.", user_cache.stats(), label="cache"))
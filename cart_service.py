@@ -0,0 +1,177 @@
+from dataclasses import dataclass
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Product, CartItem
+
+# Loads a user's cart together with its products in a single statement, so the
+# cart, payment and checkout routes never lazy-load `item.product` per line.
+# Mutations are single statements too; callers own the transaction and commit.
+
+BATCH_LIMIT = 100
+
+_UPSERT_DIALECTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+class CartError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class CartLine:
+    id: int
+    product_id: int
+    name: str
+    price: float
+    quantity: int
+    total: float
+    image_path: str
+    image_variants: dict
+    file_path: str
+    stripe_price_id: str
+    stripe_unit_amount: int
+
+
+@dataclass(frozen=True)
+class Cart:
+    lines: list
+    total: float
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    @property
+    def file_paths(self):
+        return [line.file_path for line in self.lines]
+
+
+def cart_statement(user_id):
+    line_total = (Product.price * CartItem.quantity).label("total")
+    return (
+        db.select(
+            CartItem.id,
+            CartItem.product_id,
+            Product.product_name,
+            Product.price,
+            CartItem.quantity,
+            line_total,
+            Product.image_path,
+            Product.image_variants,
+            Product.file_path,
+            Product.stripe_price_id,
+            Product.stripe_unit_amount,
+            db.func.sum(line_total).over().label("cart_total"),
+        )
+        .join(Product, CartItem.product_id == Product.id)
+        .where(CartItem.user_id == user_id)
+        .order_by(CartItem.id)
+    )
+
+
+def load_cart(user_id):
+    """Returns the user's cart lines, with line totals and the cart total computed in SQL."""
+    rows = db.session.execute(cart_statement(user_id)).all()
+    lines = [CartLine(*row[:-1]) for row in rows]
+    total = rows[0].cart_total if rows else 0.0
+    return Cart(lines=lines, total=total)
+
+
+def clear_cart(user_id):
+    db.session.execute(clear_cart_statement(user_id))
+
+
+def clear_cart_statement(user_id):
+    return db.delete(CartItem).where(CartItem.user_id == user_id)
+
+
+def add_item(user_id, product_id, quantity=1):
+    """Adds `quantity` of a product, merging into an existing line in one statement."""
+    insert = _UPSERT_DIALECTS.get(db.engine.dialect.name)
+    if insert is None:
+        return _add_item_fallback(user_id, product_id, quantity)
+    statement = insert(CartItem).values(user_id=user_id, product_id=product_id, quantity=quantity)
+    statement = statement.on_conflict_do_update(
+        index_elements=[CartItem.user_id, CartItem.product_id],
+        set_={"quantity": CartItem.quantity + statement.excluded.quantity},
+    )
+    db.session.execute(statement)
+
+
+def _add_item_fallback(user_id, product_id, quantity):
+    item = CartItem.query.filter_by(user_id=user_id, product_id=product_id).first()
+    if item:
+        item.quantity += quantity
+    else:
+        db.session.add(CartItem(user_id=user_id, product_id=product_id, quantity=quantity))
+
+
+def set_quantity(user_id, item_id, quantity):
+    """Sets a line's quantity; returns False if the user has no such line."""
+    result = db.session.execute(
+        db.update(CartItem)
+        .where(CartItem.id == item_id, CartItem.user_id == user_id)
+        .values(quantity=quantity)
+    )
+    return result.rowcount > 0
+
+
+def remove_item(user_id, item_id):
+    """Deletes a line; returns False if the user has no such line."""
+    result = db.session.execute(
+        db.delete(CartItem).where(CartItem.id == item_id, CartItem.user_id == user_id)
+    )
+    return result.rowcount > 0
+
+
+def require_positive_int(value, field):
+    if isinstance(value, bool):
+        raise CartError(f"{field} must be an integer")
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise CartError(f"{field} must be an integer")
+    if number < 1:
+        raise CartError(f"{field} must be at least 1")
+    return number
+
+
+def parse_operations(operations):
+    """Validates a batch request body, returning (op, id, quantity) tuples."""
+    if not isinstance(operations, list) or not operations:
+        raise CartError("operations must be a non-empty list")
+    if len(operations) > BATCH_LIMIT:
+        raise CartError(f"At most {BATCH_LIMIT} operations per batch")
+
+    parsed = []
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise CartError("Each operation must be an object")
+        op = operation.get("op")
+        if op == "add":
+            parsed.append((op, require_positive_int(operation.get("product_id"), "product_id"),
+                           require_positive_int(operation.get("quantity", 1), "quantity")))
+        elif op == "update":
+            parsed.append((op, require_positive_int(operation.get("item_id"), "item_id"),
+                           require_positive_int(operation.get("quantity"), "quantity")))
+        elif op == "remove":
+            parsed.append((op, require_positive_int(operation.get("item_id"), "item_id"), None))
+        else:
+            raise CartError(f"Unknown operation: {op!r}")
+    return parsed
+
+
+def apply_batch(user_id, operations):
+    """Applies every operation in order, or none of them.
+
+    Raises CartError if the batch is malformed or refers to a line the user does
+    not own; the caller should roll back in that case.
+    """
+    for op, target, quantity in parse_operations(operations):
+        if op == "add":
+            add_item(user_id, target, quantity)
+        elif op == "update":
+            if not set_quantity(user_id, target, quantity):
+                raise CartError(f"Cart item {target} not found")
+        elif not remove_item(user_id, target):
+            raise CartError(f"Cart item {target} not found")
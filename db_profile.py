@@ -0,0 +1,137 @@
+import os
+from functools import wraps
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+# Database engine profile. DATABASE_URL selects the primary (writer) database and
+# defaults to the bundled SQLite file. For SQLite every connection gets WAL and
+# the SQLITE_PRAGMAS below, and GET/HEAD requests read through a separate pool
+# of read-only connections so catalog reads never queue behind the write lock.
+# The write pool is sized for concurrent requests rather than for SQLite's
+# single writer: a checked-out connection only blocks others while it has a
+# write transaction open, and busy_timeout queues those at the lock. Code that
+# calls out to slow services (bcrypt, Stripe, mail) should still commit first
+# so it never holds the lock meanwhile. A server database can get the same
+# split by setting DATABASE_READ_URL to a replica.
+
+READ_BIND = "read"
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000, # ms to wait for the write lock before raising "database is locked"
+    "cache_size": -20000, # Negative means KiB, so about 20 MB per connection
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+READ_METHODS = ("GET", "HEAD")
+
+
+class RoutingSession(Session):
+    """Sends reads made while serving GET/HEAD requests to the read-only bind.
+
+    Anything that writes (flushes, INSERT/UPDATE/DELETE statements, or views
+    marked with @writes_db) uses the primary bind, and the session then stays on
+    it until the transaction ends so it always reads its own writes.
+    """
+
+    _wrote = False
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._can_use_read_bind(clause):
+            engine = self._db.engines.get(READ_BIND)
+            if engine is not None:
+                return engine
+        self._wrote = self._wrote or self._flushing or getattr(clause, "is_dml", False)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _can_use_read_bind(self, clause):
+        if self._wrote or self._flushing or getattr(clause, "is_dml", False):
+            return False
+        return has_request_context() and request.method in READ_METHODS and not g.get("db_write")
+
+    def commit(self):
+        super().commit()
+        self._wrote = False
+
+    def rollback(self):
+        super().rollback()
+        self._wrote = False
+
+    def close(self):
+        super().close()
+        self._wrote = False
+
+
+def writes_db(view):
+    """Marks a GET view that writes, so its reads also go to the primary database."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_write = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _sqlite_file_path(app, url):
+    # Mirrors Flask-SQLAlchemy: relative SQLite paths live in the instance folder
+    path = url[len("sqlite:///"):]
+    return path if os.path.isabs(path) else os.path.join(app.instance_path, path)
+
+
+def configure_database(app):
+    """Fills in the SQLAlchemy URI, binds and engine options. Call before db.init_app()."""
+    app.config.setdefault("SQLALCHEMY_DATABASE_URI", os.getenv("DATABASE_URL", "sqlite:///database.db"))
+    url = app.config["SQLALCHEMY_DATABASE_URI"]
+    read_url = os.getenv("DATABASE_READ_URL")
+    app.config.setdefault("DB_WRITE_POOL_SIZE", 8 if url.startswith("sqlite") else 10)
+    app.config.setdefault("DB_READ_POOL_SIZE", 8)
+    app.config.setdefault("SQLITE_PRAGMAS", SQLITE_PRAGMAS)
+
+    engine_options = {
+        "pool_size": app.config["DB_WRITE_POOL_SIZE"],
+        "max_overflow": 0,
+        "pool_timeout": 30,
+    }
+    if url.startswith("sqlite:///"):
+        os.makedirs(app.instance_path, exist_ok=True)
+        if read_url is None:
+            # The same file, opened read-only through SQLite's URI syntax
+            read_url = f"sqlite:///file:{_sqlite_file_path(app, url)}?mode=ro&uri=true"
+    else:
+        engine_options["pool_pre_ping"] = True
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options)
+
+    if read_url:
+        binds = app.config.setdefault("SQLALCHEMY_BINDS", {})
+        binds.setdefault(READ_BIND, {
+            "url": read_url,
+            "pool_size": app.config["DB_READ_POOL_SIZE"],
+            "max_overflow": 0,
+            "pool_timeout": 30,
+            "pool_pre_ping": not read_url.startswith("sqlite"),
+        })
+
+
+def install_pragmas(app, db):
+    """Applies SQLITE_PRAGMAS to every new SQLite connection. Call after db.init_app()."""
+    pragmas = app.config["SQLITE_PRAGMAS"]
+    with app.app_context():
+        engines = db.engines.items()
+    for key, engine in engines:
+        if engine.dialect.name != "sqlite":
+            continue
+        read_only = key == READ_BIND
+
+        @event.listens_for(engine, "connect")
+        def set_pragmas(dbapi_connection, connection_record, read_only=read_only):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                # journal_mode is a property of the file, and read-only connections can't set it
+                if read_only and name == "journal_mode":
+                    continue
+                cursor.execute(f"PRAGMA {name} = {value}")
+            if read_only:
+                cursor.execute("PRAGMA query_only = ON")
+            cursor.close()
@@ -0,0 +1,73 @@
+import mimetypes
+import os
+from urllib.parse import quote
+from flask import current_app, send_from_directory, url_for
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from storage import blob_store, is_private
+
+# Expiring, signed download links for purchased files. The token carries the
+# file path, so serving a download needs no database lookup. Files are streamed
+# by Werkzeug with Range support, or handed off to the front-end proxy through
+# X-Sendfile (USE_X_SENDFILE) or X-Accel-Redirect (DOWNLOAD_ACCEL_REDIRECT_PREFIX).
+# Uploaded files ("files/...") live under STORAGE_ROOT rather than the static
+# folder, so with X-Accel-Redirect the internal location must map files/ there.
+
+DOWNLOAD_DIRECTORIES = ("ebooks", "music", "files") # "files" is storage.FILE_PREFIX
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config["SECRET_KEY"], salt="download")
+
+
+def is_downloadable(file_path):
+    return bool(file_path) and file_path.split("/", 1)[0] in DOWNLOAD_DIRECTORIES
+
+
+def make_download_token(file_path, user_id):
+    return _serializer().dumps({"path": file_path, "user": user_id})
+
+
+def download_url(file_path, user_id):
+    """Returns an absolute, signed link to `file_path`, or None if it can't be downloaded."""
+    if not is_downloadable(file_path):
+        return None
+    return url_for("main.download", token=make_download_token(file_path, user_id), _external=True)
+
+
+def read_download_token(token):
+    """Returns the file path in `token`, or None if it is forged or expired."""
+    try:
+        payload = _serializer().loads(token, max_age=current_app.config["DOWNLOAD_LINK_MAX_AGE"])
+    except BadSignature:
+        return None
+    file_path = payload.get("path")
+    return file_path if is_downloadable(file_path) else None
+
+
+def file_location(file_path):
+    """Returns (directory, relative path) of a downloadable file on disk."""
+    if is_private(file_path):
+        return blob_store.locate(file_path)
+    return current_app.static_folder, file_path
+
+
+def send_download(file_path):
+    """Streams a purchased file; raises NotFound if it is missing."""
+    download_name = os.path.basename(file_path)
+    accel_prefix = current_app.config.get("DOWNLOAD_ACCEL_REDIRECT_PREFIX")
+    if accel_prefix:
+        # nginx serves the file (including Range requests) from its internal location
+        response = current_app.response_class(
+            mimetype=mimetypes.guess_type(download_name)[0] or "application/octet-stream"
+        )
+        response.headers["X-Accel-Redirect"] = accel_prefix.rstrip("/") + "/" + quote(file_path)
+        response.headers.set("Content-Disposition", "attachment", filename=download_name)
+        return response
+    directory, relative_path = file_location(file_path)
+    return send_from_directory(
+        directory,
+        relative_path,
+        as_attachment=True,
+        download_name=download_name,
+        max_age=0,
+    )
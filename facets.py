@@ -0,0 +1,205 @@
+from bisect import bisect_right
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import case, event, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import attributes
+from db_profile import RoutingSession
+from models import db, Product, CategoryFacet
+
+# Faceted browse counts from a materialized aggregate. category_facet holds one
+# row per (category, price bucket) with its product count and min/max price,
+# and an after_flush hook applies every Product insert, update and delete to
+# it in the same transaction, so reads never GROUP BY the product table.
+# Min/max are re-read for the touched rows only, each an O(log n) lookup on
+# ix_product_category_price. A price filter takes the aggregate rows it fully
+# covers as they are and counts exactly only in the (at most two) buckets per
+# category that it cuts through, along the same index. Writes that bypass the
+# ORM must call rebuild_facets() afterwards, as `flask rebuild-facets` does.
+
+# Lower bound of each price bucket; the last one is open-ended
+PRICE_BUCKETS = (0, 5, 10, 25, 50, 100, 250)
+
+_UPSERT_DIALECTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+_facets = CategoryFacet.__table__
+_products = Product.__table__
+
+
+def bucket_for(price):
+    return max(0, bisect_right(PRICE_BUCKETS, price) - 1)
+
+
+def bucket_bounds(bucket):
+    """Returns (low, high) of a bucket; high is exclusive and None for the last one."""
+    high = PRICE_BUCKETS[bucket + 1] if bucket + 1 < len(PRICE_BUCKETS) else None
+    return PRICE_BUCKETS[bucket], high
+
+
+def _in_bucket(column, bucket):
+    low, high = bucket_bounds(bucket)
+    condition = column >= low
+    return condition if high is None else condition & (column < high)
+
+
+def _facet_changes(session):
+    """Maps (category, bucket) to the count change this flush makes; None if it can't tell."""
+    deltas = {}
+
+    def move(category, price, step):
+        key = (category, bucket_for(price))
+        deltas[key] = deltas.get(key, 0) + step
+
+    for product in session.new:
+        if isinstance(product, Product):
+            move(product.category, product.price, 1)
+    for product in session.deleted:
+        if isinstance(product, Product):
+            move(product.category, product.price, -1)
+    for product in session.dirty:
+        if not isinstance(product, Product):
+            continue
+        category = attributes.get_history(product, "category")
+        price = attributes.get_history(product, "price")
+        if not category.has_changes() and not price.has_changes():
+            continue
+        if (category.added and not category.deleted) or (price.added and not price.deleted):
+            return None # The old value was never loaded
+        old_category = category.deleted[0] if category.deleted else product.category
+        old_price = price.deleted[0] if price.deleted else product.price
+        move(old_category, old_price, -1)
+        move(product.category, product.price, 1)
+    return deltas
+
+
+def _upsert_count(conn, category, bucket, delta):
+    insert = _UPSERT_DIALECTS.get(conn.dialect.name)
+    if insert is None:
+        updated = conn.execute(
+            _facets.update()
+            .where(_facets.c.category == category, _facets.c.bucket == bucket)
+            .values(product_count=_facets.c.product_count + delta)
+        )
+        if not updated.rowcount:
+            conn.execute(_facets.insert().values(category=category, bucket=bucket, product_count=delta))
+        return
+    statement = insert(_facets).values(category=category, bucket=bucket, product_count=delta)
+    conn.execute(statement.on_conflict_do_update(
+        index_elements=[_facets.c.category, _facets.c.bucket],
+        set_={"product_count": _facets.c.product_count + statement.excluded.product_count},
+    ))
+
+
+def _refresh_range(conn, category, bucket):
+    where = (_facets.c.category == category) & (_facets.c.bucket == bucket)
+    in_slice = (_products.c.category == category) & _in_bucket(_products.c.price, bucket)
+    conn.execute(_facets.delete().where(where, _facets.c.product_count <= 0))
+    conn.execute(_facets.update().where(where).values(
+        min_price=db.select(func.min(_products.c.price)).where(in_slice).scalar_subquery(),
+        max_price=db.select(func.max(_products.c.price)).where(in_slice).scalar_subquery(),
+    ))
+
+
+def apply_facet_changes(conn, deltas):
+    for (category, bucket), delta in deltas.items():
+        if delta:
+            _upsert_count(conn, category, bucket, delta)
+        # A price move inside one bucket leaves the count alone but may change its range
+        _refresh_range(conn, category, bucket)
+
+
+def rebuild_facets(conn):
+    """Recomputes the whole aggregate from the product table."""
+    bucket = case(
+        *((_in_bucket(_products.c.price, index), index) for index in range(len(PRICE_BUCKETS))),
+        else_=0,
+    ).label("bucket")
+    grouped = (
+        db.select(_products.c.category, bucket, func.count(), func.min(_products.c.price), func.max(_products.c.price))
+        .group_by(_products.c.category, bucket)
+    )
+    conn.execute(_facets.delete())
+    conn.execute(_facets.insert().from_select(
+        ["category", "bucket", "product_count", "min_price", "max_price"], grouped,
+    ))
+
+
+def _after_flush(session, flush_context):
+    deltas = _facet_changes(session)
+    if deltas is None:
+        rebuild_facets(session.connection())
+    elif deltas:
+        apply_facet_changes(session.connection(), deltas)
+
+
+def slice_statement(category_name, low, high):
+    """Exact count and range of one category's products in [low, high], read along the index."""
+    statement = (
+        db.select(func.count(), func.min(Product.price), func.max(Product.price))
+        .where(Product.category == category_name)
+    )
+    if low is not None:
+        statement = statement.where(Product.price >= low)
+    if high is not None:
+        statement = statement.where(Product.price <= high)
+    return statement
+
+
+def _filtered(row, prices):
+    """Returns (count, min, max) of an aggregate row restricted to `prices`."""
+    if row.product_count <= 0 or not prices.overlaps(row.min_price, row.max_price):
+        return 0, None, None
+    if prices.contains(row.min_price, row.max_price):
+        return row.product_count, row.min_price, row.max_price
+    # The filter cuts through this bucket, so count its part exactly
+    bucket_low, bucket_high = bucket_bounds(row.bucket)
+    low = bucket_low if prices.low is None else max(bucket_low, prices.low)
+    statement = slice_statement(row.category, low, prices.high)
+    if bucket_high is not None:
+        statement = statement.where(Product.price < bucket_high) # Bucket bounds are half-open
+    return tuple(db.session.execute(statement).one())
+
+
+def browse_facets(category_name=None, prices=None):
+    """Returns counts per category plus the price histogram and range of `category_name` (or the whole catalog).
+
+    With `prices`, everything is restricted to that range.
+    """
+    rows = db.session.execute(db.select(CategoryFacet).order_by(CategoryFacet.category, CategoryFacet.bucket)).scalars()
+    categories, buckets = {}, {}
+    low = high = None
+    for row in rows:
+        if prices:
+            count, row_min, row_max = _filtered(row, prices)
+        else:
+            count, row_min, row_max = row.product_count, row.min_price, row.max_price
+        categories[row.category] = categories.get(row.category, 0) + count
+        if category_name is not None and row.category != category_name:
+            continue
+        buckets[row.bucket] = buckets.get(row.bucket, 0) + count
+        if count:
+            low = row_min if low is None else min(low, row_min)
+            high = row_max if high is None else max(high, row_max)
+    histogram = []
+    for index in range(len(PRICE_BUCKETS)):
+        bucket_low, bucket_high = bucket_bounds(index)
+        histogram.append({"min": bucket_low, "max": bucket_high, "count": buckets.get(index, 0)})
+    return {
+        "categories": [{"name": name, "count": count} for name, count in categories.items()],
+        "price": {"min": low, "max": high, "buckets": histogram},
+    }
+
+
+@click.command("rebuild-facets")
+@with_appcontext
+def rebuild_facets_command():
+    """Recomputes the browse facets from the product table."""
+    with db.engine.begin() as conn:
+        rebuild_facets(conn)
+    click.echo("Rebuilt the browse facets.")
+
+
+def init_app(app):
+    if not event.contains(RoutingSession, "after_flush", _after_flush):
+        event.listen(RoutingSession, "after_flush", _after_flush)
+    app.cli.add_command(rebuild_facets_command)
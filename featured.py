@@ -0,0 +1,70 @@
+import random
+import threading
+import time
+from models import db, Product
+from cache import catalog_cache
+
+
+class FeaturedProducts:
+    """Picks the home page's featured products from an in-memory pool of product ids.
+
+    Sampling is O(k) in the number of products shown, so the home page costs the
+    same regardless of catalog size. With FEATURED_ROTATE_SECONDS set, one sample
+    is precomputed and served to everyone until the interval elapses.
+    """
+
+    def __init__(self, app=None):
+        self.count = 6
+        self.rotate_seconds = 0
+        self._ids = None
+        self._featured = None
+        self._featured_at = 0.0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("FEATURED_PRODUCT_COUNT", 6)
+        app.config.setdefault("FEATURED_ROTATE_SECONDS", 0)
+        self.count = app.config["FEATURED_PRODUCT_COUNT"]
+        self.rotate_seconds = app.config["FEATURED_ROTATE_SECONDS"]
+        app.extensions["featured_products"] = self
+
+    def _pool(self):
+        if self._ids is None:
+            with self._lock:
+                if self._ids is None:
+                    self._ids = list(db.session.scalars(db.select(Product.id)))
+        return self._ids
+
+    def refresh(self):
+        """Forgets the id pool and the current rotation; both reload on next use."""
+        with self._lock:
+            self._ids = None
+            self._featured = None
+
+    def add(self, product_id):
+        """Adds a newly created product to the pool without reloading it."""
+        with self._lock:
+            if self._ids is not None:
+                self._ids.append(product_id)
+
+    def sample(self, k=None):
+        """Returns up to `k` distinct products chosen uniformly at random."""
+        k = k or self.count
+        pool = self._pool()
+        return catalog_cache.get_products(random.sample(pool, min(k, len(pool))))
+
+    def get(self):
+        """Returns the products to feature on the home page right now."""
+        if not self.rotate_seconds:
+            return self.sample()
+        now = time.monotonic()
+        featured = self._featured
+        if featured is None or now - self._featured_at >= self.rotate_seconds:
+            featured = self.sample()
+            self._featured, self._featured_at = featured, now
+        return featured
+
+
+featured_products = FeaturedProducts()
@@ -25,4 +25,5 @@ class ProductForm(FlaskForm):
     price = FloatField("Price", validators=[DataRequired()])
     category = StringField("Category", validators=[DataRequired(), Length(max=255)])
     image = FileField("Product Image", validators=[FileRequired(), FileAllowed(['jpg', 'png', 'jpeg'], 'Images only!')])
+    file = FileField("Download File", validators=[FileRequired(), FileAllowed(['pdf', 'epub', 'mobi', 'mp3', 'wav', 'flac', 'ogg', 'm4a', 'zip', 'txt'], 'Unsupported file type!')])
     submit = SubmitField("Upload Product")
\ No newline at end of file
@@ -0,0 +1,194 @@
+import logging
+import threading
+from datetime import timedelta
+import click
+from sqlalchemy.exc import IntegrityError
+from models import db, FulfillmentJob, utcnow
+
+# Delivers purchased files off the request path. thank_you() records a job in the
+# fulfillment_job table and returns; a pool of worker threads (or a separate
+# `flask fulfillment-worker` process) claims due jobs, sends them through the
+# configured mail transport and retries failures with exponential backoff.
+
+logger = logging.getLogger(__name__)
+
+
+class MailjetTransport:
+    """Sends the purchase email through Mailjet."""
+
+    def send(self, recipient, file_paths, user_id=None):
+        from send_email import send_email
+        send_email(recipient, file_paths, user_id)
+
+
+class LocalMailTransport:
+    """Keeps messages in memory instead of sending them; for tests and local runs."""
+
+    def __init__(self, fail_times=0):
+        self.outbox = []
+        self.fail_times = fail_times
+
+    def send(self, recipient, file_paths, user_id=None):
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise RuntimeError("Simulated delivery failure")
+        self.outbox.append({"recipient": recipient, "file_paths": list(file_paths)})
+
+
+TRANSPORTS = {"mailjet": MailjetTransport, "local": LocalMailTransport}
+
+
+class FulfillmentQueue:
+    def __init__(self, app=None):
+        self.app = None
+        self.transport = None
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("FULFILLMENT_TRANSPORT", "mailjet")
+        app.config.setdefault("FULFILLMENT_WORKERS", 2) # 0 leaves delivery to `flask fulfillment-worker`
+        app.config.setdefault("FULFILLMENT_MAX_ATTEMPTS", 5)
+        app.config.setdefault("FULFILLMENT_BACKOFF_SECONDS", 30) # Doubles after every failed attempt
+        app.config.setdefault("FULFILLMENT_POLL_SECONDS", 5)
+        app.config.setdefault("FULFILLMENT_CLAIM_TIMEOUT", 600) # Reclaim jobs from workers that died mid-send
+        self.app = app
+        transport = app.config["FULFILLMENT_TRANSPORT"]
+        self.transport = TRANSPORTS[transport]() if isinstance(transport, str) else transport
+        app.extensions["fulfillment"] = self
+        app.cli.add_command(fulfillment_worker_command)
+
+    # Producer side
+
+    def enqueue(self, order_key, user_id, recipient, file_paths, items):
+        """Records a delivery job, or returns the existing one for `order_key`."""
+        job = FulfillmentJob.query.filter_by(order_key=order_key).first()
+        if job:
+            return job
+        job = FulfillmentJob(
+            order_key=order_key,
+            user_id=user_id,
+            recipient=recipient,
+            file_paths=file_paths,
+            items=items,
+        )
+        db.session.add(job)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            # A concurrent request for the same order got there first
+            db.session.rollback()
+            return FulfillmentJob.query.filter_by(order_key=order_key).one()
+        return job
+
+    def notify(self):
+        """Wakes the workers after a job has been committed."""
+        self._ensure_workers()
+        self._wakeup.set()
+
+    # Worker side
+
+    def _ensure_workers(self):
+        count = self.app.config["FULFILLMENT_WORKERS"]
+        if len(self._threads) >= count:
+            return
+        with self._start_lock:
+            while len(self._threads) < count:
+                thread = threading.Thread(
+                    target=self.run_worker,
+                    name=f"fulfillment-{len(self._threads)}",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def run_worker(self):
+        poll = self.app.config["FULFILLMENT_POLL_SECONDS"]
+        while not self._stop.is_set():
+            with self.app.app_context():
+                processed = self.process_due_jobs()
+            if not processed:
+                self._wakeup.wait(poll)
+                self._wakeup.clear()
+
+    def process_due_jobs(self, limit=10):
+        """Claims and delivers up to `limit` due jobs; returns how many were attempted."""
+        now = utcnow()
+        stale = now - timedelta(seconds=self.app.config["FULFILLMENT_CLAIM_TIMEOUT"])
+        claimable = claimable_condition(now, stale)
+        candidates = db.session.scalars(due_jobs_statement(claimable, limit)).all()
+
+        attempted = 0
+        for job_id in candidates:
+            if self._claim(job_id, claimable):
+                self._deliver(db.session.get(FulfillmentJob, job_id))
+                attempted += 1
+        db.session.remove()
+        return attempted
+
+    def _claim(self, job_id, claimable):
+        # The status check in the WHERE clause makes the claim atomic across workers
+        result = db.session.execute(
+            db.update(FulfillmentJob)
+            .where(FulfillmentJob.id == job_id, claimable)
+            .values(status="processing", attempts=FulfillmentJob.attempts + 1, updated_at=utcnow())
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def _deliver(self, job):
+        recipient, file_paths, user_id = job.recipient, job.file_paths, job.user_id
+        # Ends the read and hands the connection back to the pool while the mail goes out
+        db.session.commit()
+        try:
+            self.transport.send(recipient, file_paths, user_id)
+        except Exception as e:
+            logger.warning("Fulfillment of %s failed (attempt %d): %s", job.order_key, job.attempts, e)
+            job.last_error = str(e)
+            if job.attempts >= self.app.config["FULFILLMENT_MAX_ATTEMPTS"]:
+                job.status = "failed"
+            else:
+                backoff = self.app.config["FULFILLMENT_BACKOFF_SECONDS"] * 2 ** (job.attempts - 1)
+                job.status = "pending"
+                job.next_attempt_at = utcnow() + timedelta(seconds=backoff)
+        else:
+            job.status = "sent"
+            job.last_error = None
+        db.session.commit()
+
+
+def claimable_condition(now, stale):
+    due = (FulfillmentJob.status == "pending") & (FulfillmentJob.next_attempt_at <= now)
+    abandoned = (FulfillmentJob.status == "processing") & (FulfillmentJob.updated_at < stale)
+    return due | abandoned
+
+
+def due_jobs_statement(claimable, limit):
+    return (
+        db.select(FulfillmentJob.id)
+        .where(claimable)
+        .order_by(FulfillmentJob.next_attempt_at)
+        .limit(limit)
+    )
+
+
+fulfillment_queue = FulfillmentQueue()
+
+
+@click.command("fulfillment-worker")
+@click.option("--once", is_flag=True, help="Process the jobs that are due now and exit.")
+def fulfillment_worker_command(once):
+    """Runs a fulfillment worker in the foreground."""
+    if once:
+        with fulfillment_queue.app.app_context():
+            click.echo(f"Processed {fulfillment_queue.process_due_jobs(limit=1000)} job(s).")
+        return
+    fulfillment_queue.run_worker()
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from flask import current_app, make_response, request
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+from models import db, CatalogVersion, utcnow
+from assets import static_assets
+from cache import catalog_cache
+from featured import featured_products
+from metrics import REGISTRY, stats_gauges
+
+# Conditional GET for catalog responses. Catalog-wide responses (category
+# fragments, search results) are validated by the catalog version, a single
+# database row that every catalog write bumps in its own transaction; product
+# pages are validated by the product's updated_at. ETags also carry a release
+# token (a hash of the templates and the static manifest) so a deploy that
+# changes the markup never answers 304 for old bodies. Each worker rereads the
+# version at most every CATALOG_VERSION_TTL seconds, and dropping its catalog
+# caches when the version moves is what makes an upload on one worker visible
+# on the others.
+
+
+@dataclass(frozen=True)
+class Validators:
+    etag: str
+    last_modified: datetime = None
+    private: bool = False # Only the requesting browser may store it
+    vary_cookie: bool = False # The body depends on the session
+
+
+def _release_token(app):
+    digest = hashlib.sha256()
+    template_folder = os.path.join(app.root_path, app.template_folder)
+    for root, dirs, files in os.walk(template_folder):
+        dirs.sort() # Walk in the same order on every worker
+        for name in sorted(files):
+            digest.update(name.encode())
+            with open(os.path.join(root, name), "rb") as f:
+                digest.update(f.read())
+    digest.update(json.dumps(static_assets.manifest, sort_keys=True).encode())
+    return digest.hexdigest()[:10]
+
+
+def _http_time(value):
+    # HTTP dates have whole seconds; stored timestamps are naive UTC
+    return value.replace(tzinfo=timezone.utc, microsecond=0) if value else None
+
+
+class HttpCache:
+    def __init__(self, app=None):
+        self.version_ttl = 5
+        self.shared_max_age = 30
+        self.release = ""
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.not_modified = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Call after static_assets.init_app() so the manifest is part of the release token."""
+        app.config.setdefault("CATALOG_VERSION_TTL", 5) # Seconds a worker trusts its copy of the version
+        app.config.setdefault("CATALOG_SHARED_MAX_AGE", 30) # s-maxage for catalog responses on the proxy
+        self.version_ttl = app.config["CATALOG_VERSION_TTL"]
+        self.shared_max_age = app.config["CATALOG_SHARED_MAX_AGE"]
+        self.release = _release_token(app)
+        app.extensions["http_cache"] = self
+
+    def catalog_version(self):
+        """Returns (version, updated_at) of the catalog, reading the database at most every CATALOG_VERSION_TTL seconds."""
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.version_ttl:
+            return self._version
+        row = db.session.execute(db.select(CatalogVersion.version, CatalogVersion.updated_at)).first()
+        version = (row.version, row.updated_at) if row else (0, None)
+        with self._lock:
+            if self._version is not None and self._version[0] != version[0]:
+                # Another worker changed the catalog; don't keep serving what it replaced
+                catalog_cache.clear()
+                featured_products.refresh()
+            self._version, self._checked_at = version, now
+        return version
+
+    def bump_catalog_version(self):
+        """Marks the catalog changed. Call inside the transaction that changes it, before the commit."""
+        db.session.execute(db.update(CatalogVersion).values(version=CatalogVersion.version + 1, updated_at=utcnow()))
+        self._checked_at = 0.0
+
+    def for_catalog(self, vary_cookie=False):
+        """Validators for responses that only depend on the catalog.
+
+        Pass vary_cookie=True for rendered templates: Flask-Login's context
+        processor reads the session, so Flask adds Vary: Cookie to the 200 and
+        the 304 has to match it.
+        """
+        version, updated_at = self.catalog_version()
+        return Validators(etag=f"c{version}-{self.release}", last_modified=_http_time(updated_at), vary_cookie=vary_cookie)
+
+    def for_product(self, product):
+        """Validators for a product page; `product` is a cached ProductSnapshot, so this needs no query."""
+        # The navigation differs for signed-in visitors
+        audience = "a" if current_user.is_authenticated else "g"
+        stamp = product.updated_at.strftime("%Y%m%d%H%M%S%f") if product.updated_at else "0"
+        return Validators(
+            etag=f"p{product.id}-{stamp}-{audience}-{self.release}",
+            last_modified=_http_time(product.updated_at),
+            private=current_user.is_authenticated,
+            vary_cookie=True,
+        )
+
+    def _apply(self, response, validators):
+        response.set_etag(validators.etag, weak=True)
+        if validators.last_modified:
+            response.last_modified = validators.last_modified
+        # Browsers always revalidate; the proxy may reuse a public response for CATALOG_SHARED_MAX_AGE
+        response.cache_control.max_age = 0
+        if validators.private:
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+        else:
+            response.cache_control.public = True
+            response.cache_control.s_maxage = self.shared_max_age
+        if validators.vary_cookie:
+            response.vary.add("Cookie")
+        return response
+
+    def respond(self, validators, render):
+        """Returns 304 when the request already holds this version, otherwise render() with the validators attached."""
+        if not is_resource_modified(request.environ, etag=validators.etag, last_modified=validators.last_modified):
+            self.not_modified += 1
+            return self._apply(current_app.response_class(status=304), validators)
+        response = make_response(render())
+        if response.status_code != 200:
+            return response
+        return self._apply(response, validators)
+
+    def stats(self):
+        version = self._version[0] if self._version else 0
+        return {"catalog_version": version, "not_modified": self.not_modified}
+
+
+http_cache = HttpCache()
+REGISTRY.add_collector(lambda: stats_gauges("bytemarket_http_cache", "Conditional GET state.", http_cache.stats()))
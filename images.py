@@ -0,0 +1,159 @@
+import hashlib
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from PIL import Image, ImageOps
+from models import db, Product
+
+# Derivative images for product listings. Every product image gets fixed-size
+# thumbnails in WebP plus a JPEG/PNG fallback, stored under content-hashed names
+# so they can be cached forever. SVGs are minified instead: Pillow can't
+# rasterize them, and the traced artwork mostly carries excess coordinate
+# precision. Variant paths are stored in Product.image_variants.
+
+DERIVED_FOLDER = "product_images/derived"
+
+# Longest edge in pixels for each named size
+IMAGE_SIZES = {"thumb": 320, "medium": 800}
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+_NUMBER_RE = re.compile(r"-?\d+\.\d+")
+_DEFAULT_ATTRS_RE = re.compile(r'\s(?:opacity="1"|stroke="none")')
+_PATH_COMMAND_RE = re.compile(r"\s*([MmLlHhVvCcSsQqTtAaZz])\s*")
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def _round_number(match):
+    value = round(float(match.group(0)), 1)
+    return str(int(value)) if value == int(value) else f"{value:.1f}"
+
+
+def minify_svg(markup):
+    """Shrinks traced SVG markup by rounding coordinates to 0.1px and dropping redundant whitespace."""
+    markup = re.sub(r"<!--.*?-->", "", markup, flags=re.DOTALL)
+    markup = _NUMBER_RE.sub(_round_number, markup)
+    markup = re.sub(r"\s+", " ", markup)
+    markup = re.sub(r">\s+<", "><", markup)
+    markup = _DEFAULT_ATTRS_RE.sub("", markup)
+    return re.sub(r'\sd="([^"]*)"', lambda m: ' d="' + _PATH_COMMAND_RE.sub(r"\1", m.group(1)).strip() + '"', markup)
+
+
+def _save_raster(image, path, has_alpha):
+    if has_alpha:
+        image.save(path, "PNG", optimize=True)
+    else:
+        image.convert("RGB").save(path, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+
+
+def process_image(static_folder, image_path, source=None):
+    """Writes the derivatives of one image and returns {size: {"src": ..., "webp": ...}}.
+
+    Runs in worker processes during backfill, so it only touches the filesystem.
+    Existing derivatives are reused, which makes re-runs cheap. `source` reads
+    the image from another file, such as an upload not yet moved to `image_path`.
+    """
+    source = source or os.path.join(static_folder, image_path)
+    digest = _file_digest(source)
+    folder = os.path.join(static_folder, DERIVED_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+
+    if image_path.lower().endswith(".svg"):
+        name = f"{digest}.min.svg"
+        target = os.path.join(folder, name)
+        if not os.path.exists(target):
+            with open(source, "r", encoding="utf-8") as f:
+                markup = minify_svg(f.read())
+            with open(target + ".tmp", "w", encoding="utf-8") as f:
+                f.write(markup)
+            os.replace(target + ".tmp", target)
+        variant = {"src": f"{DERIVED_FOLDER}/{name}", "webp": None}
+        return {size: variant for size in IMAGE_SIZES}
+
+    variants = {}
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        has_alpha = original.mode in ("RGBA", "LA", "P")
+        original = original.convert("RGBA" if has_alpha else "RGB")
+        fallback_ext = "png" if has_alpha else "jpg"
+        for size, edge in IMAGE_SIZES.items():
+            base = f"{digest}-{edge}"
+            fallback_name, webp_name = f"{base}.{fallback_ext}", f"{base}.webp"
+            if not (os.path.exists(os.path.join(folder, fallback_name)) and os.path.exists(os.path.join(folder, webp_name))):
+                image = original.copy()
+                image.thumbnail((edge, edge), Image.LANCZOS)
+                _save_raster(image, os.path.join(folder, fallback_name), has_alpha)
+                image.save(os.path.join(folder, webp_name), "WEBP", quality=WEBP_QUALITY, method=4)
+            variants[size] = {"src": f"{DERIVED_FOLDER}/{fallback_name}", "webp": f"{DERIVED_FOLDER}/{webp_name}"}
+    return variants
+
+
+def try_process_image(static_folder, image_path, source=None):
+    """Like process_image(), but returns None when the source is missing or unreadable."""
+    try:
+        return process_image(static_folder, image_path, source)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        current_app.logger.warning("Could not process image %s: %s", image_path, e)
+        return None
+
+
+def product_image(product, size="thumb"):
+    """Template helper: the best stored variant of a product's image, falling back to the original."""
+    variant = (product.image_variants or {}).get(size)
+    if variant:
+        return variant
+    return {"src": product.image_path, "webp": None}
+
+
+def init_app(app):
+    app.jinja_env.globals["product_image"] = product_image
+    app.cli.add_command(images_cli)
+
+
+images_cli = AppGroup("images", help="Product image derivatives.")
+
+
+def _process_job(job):
+    # Top-level so ProcessPoolExecutor can pickle it
+    static_folder, product_id, image_path = job
+    try:
+        return product_id, process_image(static_folder, image_path), None
+    except Exception as e:
+        return product_id, None, str(e)
+
+
+@images_cli.command("backfill")
+@click.option("--workers", default=os.cpu_count() or 1, show_default=True, help="Worker processes.")
+@click.option("--force", is_flag=True, help="Reprocess products that already have variants.")
+def backfill_command(workers, force):
+    """Generates image derivatives for existing products."""
+    query = db.select(Product.id, Product.image_path).where(Product.image_path.isnot(None))
+    if not force:
+        query = query.where(Product.image_variants.is_(None))
+    static_folder = current_app.static_folder
+    jobs = [(static_folder, product_id, image_path) for product_id, image_path in db.session.execute(query)]
+
+    done = failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for product_id, variants, error in pool.map(_process_job, jobs, chunksize=4):
+            if error:
+                failed += 1
+                click.echo(f"Product {product_id}: {error}", err=True)
+                continue
+            db.session.execute(db.update(Product).where(Product.id == product_id).values(image_variants=variants))
+            done += 1
+            if done % 100 == 0:
+                db.session.commit()
+    db.session.commit()
+    click.echo(f"Processed {done} image(s), {failed} failed.")
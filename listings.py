@@ -0,0 +1,147 @@
+import base64
+import binascii
+import json
+import math
+from dataclasses import dataclass
+from sqlalchemy import and_, or_
+from models import db, Product
+
+# Keyset pagination for product listings. Each page is read with a bounded
+# LIMIT that continues strictly after the last row of the previous page, so
+# deep pages cost the same as the first one. The position travels to the
+# client as an opaque `cursor` token.
+
+PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+# Only what a product card renders; descriptions and file paths stay in the database
+LISTING_COLUMNS = (
+    Product.id,
+    Product.product_name,
+    Product.price,
+    Product.image_path,
+    Product.image_variants,
+)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class InvalidPriceRange(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Page:
+    items: tuple
+    next_cursor: str = None
+
+
+@dataclass(frozen=True)
+class PriceRange:
+    """Inclusive price bounds; either side may be open (None)."""
+    low: float = None
+    high: float = None
+
+    def __bool__(self):
+        return self.low is not None or self.high is not None
+
+    def contains(self, low, high):
+        """True if every price in [low, high] is inside the range."""
+        return (self.low is None or low >= self.low) and (self.high is None or high <= self.high)
+
+    def overlaps(self, low, high):
+        return (self.low is None or high >= self.low) and (self.high is None or low <= self.high)
+
+
+def price_range(low=None, high=None):
+    """Validates request bounds, raising InvalidPriceRange for non-finite, negative or inverted ones."""
+    for value in (low, high):
+        if value is not None and (not math.isfinite(value) or value < 0):
+            raise InvalidPriceRange("Prices must be non-negative numbers")
+    if low is not None and high is not None and low > high:
+        raise InvalidPriceRange("min_price is above max_price")
+    return PriceRange(low, high)
+
+
+def encode_cursor(*values):
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(token, arity):
+    """Returns the values packed by encode_cursor(), raising InvalidCursor if `token` is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != arity:
+        raise InvalidCursor("Invalid cursor")
+    if not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+        raise InvalidCursor("Invalid cursor")
+    return values
+
+
+def page_size(value):
+    """Clamps a requested page size to 1..MAX_PAGE_SIZE, using PAGE_SIZE when none was given."""
+    if value is None:
+        return PAGE_SIZE
+    return max(1, min(value, MAX_PAGE_SIZE))
+
+
+def paginate(rows, limit, key):
+    # Callers fetch limit + 1 rows: the extra one only says whether a next page exists
+    rows = tuple(rows)
+    if len(rows) <= limit:
+        return Page(items=rows)
+    items = rows[:limit]
+    return Page(items=items, next_cursor=encode_cursor(*key(items[-1])))
+
+
+def category_statement(category_name, after_id=None, limit=PAGE_SIZE):
+    statement = (
+        db.select(*LISTING_COLUMNS)
+        .where(Product.category == category_name)
+        .order_by(Product.id)
+        .limit(limit + 1)
+    )
+    if after_id is not None:
+        statement = statement.where(Product.id > after_id)
+    return statement
+
+
+def category_page(category_name, cursor=None, limit=PAGE_SIZE):
+    """Returns one page of product cards in `category_name`, oldest product first."""
+    after_id = decode_cursor(cursor, 1)[0] if cursor else None
+    rows = db.session.execute(category_statement(category_name, after_id, limit)).all()
+    return paginate(rows, limit, key=lambda row: (row.id,))
+
+
+def price_range_statement(category_name, prices, after=None, limit=PAGE_SIZE):
+    """Products in `category_name` within `prices`, cheapest first, read along ix_product_category_price."""
+    statement = (
+        db.select(*LISTING_COLUMNS)
+        .where(Product.category == category_name)
+        .order_by(Product.price, Product.id)
+        .limit(limit + 1)
+    )
+    if prices.low is not None:
+        statement = statement.where(Product.price >= prices.low)
+    if prices.high is not None:
+        statement = statement.where(Product.price <= prices.high)
+    if after is not None:
+        after_price, after_id = after
+        statement = statement.where(or_(
+            Product.price > after_price,
+            and_(Product.price == after_price, Product.id > after_id),
+        ))
+    return statement
+
+
+def price_range_page(category_name, prices, cursor=None, limit=PAGE_SIZE):
+    """Returns one page of product cards in `category_name` priced within `prices`."""
+    after = decode_cursor(cursor, 2) if cursor else None
+    rows = db.session.execute(price_range_statement(category_name, prices, after, limit)).all()
+    return paginate(rows, limit, key=lambda row: (row.price, row.id))
@@ -0,0 +1,182 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from metrics import REGISTRY, stats_gauges, track_external
+
+# Long-lived outbound mail transport. Messages submitted from any thread are
+# coalesced for up to MAIL_BATCH_WINDOW seconds and sent as one Mailjet v3.1
+# request over a pooled keep-alive session; each caller gets its own result.
+
+logger = logging.getLogger(__name__)
+
+MAILJET_SEND_URL = "https://api.mailjet.com/v3.1/send"
+MAILJET_BATCH_LIMIT = 50 # Maximum messages per v3.1 send call
+
+
+class MailDeliveryError(Exception):
+    pass
+
+
+class MailjetBackend:
+    """Posts batches to the Mailjet v3.1 send API over a pooled session."""
+
+    def __init__(self, api_key, api_secret, timeout=10, pool_size=4, retries=2):
+        self.auth = (api_key, api_secret)
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.retries = retries
+        self._session = None
+
+    @property
+    def session(self):
+        # Built by the sender thread on first use, so no sockets exist before workers fork
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            session = requests.Session()
+            session.auth = self.auth
+            # The send POST is not idempotent: a gateway 5xx or a read timeout may come
+            # after Mailjet accepted the batch, and the fulfillment job retries those
+            # itself. Only failures where nothing was sent are retried here: connect
+            # errors, and 429, which Mailjet returns before processing the request.
+            retry = Retry(total=self.retries, connect=self.retries, read=0, other=0, status=self.retries,
+                          backoff_factor=0.5, status_forcelist=(429,), allowed_methods=None)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+            session.mount("https://", adapter)
+            self._session = session
+        return self._session
+
+    def send_batch(self, messages):
+        """Returns one result dict per message, in order."""
+        with track_external("mailjet", "send"):
+            response = self.session.post(MAILJET_SEND_URL, json={"Messages": messages}, timeout=self.timeout)
+        body = response.json() if response.content else {}
+        results = body.get("Messages")
+        if results is None or len(results) != len(messages):
+            raise MailDeliveryError(f"Mailjet returned {response.status_code}: {body}")
+        return results
+
+
+class LocalBackend:
+    """Records batches instead of sending them; for tests and local runs."""
+
+    def __init__(self):
+        self.batches = []
+
+    def send_batch(self, messages):
+        self.batches.append(list(messages))
+        return [{"Status": "success"} for _ in messages]
+
+
+class MailTransport:
+    def __init__(self, app=None):
+        self.backend = None
+        self.batch_window = 0.05
+        self.send_timeout = 30
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self.metrics = {
+            "batches_sent": 0,
+            "batches_failed": 0,
+            "messages_sent": 0,
+            "messages_failed": 0,
+            "send_seconds": 0.0,
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("MAIL_BACKEND", "mailjet") # mailjet or local
+        app.config.setdefault("MAIL_BATCH_WINDOW", 0.05)
+        app.config.setdefault("MAIL_HTTP_TIMEOUT", 10)
+        app.config.setdefault("MAIL_POOL_SIZE", 4)
+        app.config.setdefault("MAIL_SEND_TIMEOUT", 30) # How long a caller waits for its batch
+        self.batch_window = app.config["MAIL_BATCH_WINDOW"]
+        self.send_timeout = app.config["MAIL_SEND_TIMEOUT"]
+        backend = app.config["MAIL_BACKEND"]
+        if backend == "mailjet":
+            backend = MailjetBackend(
+                os.getenv("MJ_APIKEY_PUBLIC"),
+                os.getenv("MJ_APIKEY_SECRET"),
+                timeout=app.config["MAIL_HTTP_TIMEOUT"],
+                pool_size=app.config["MAIL_POOL_SIZE"],
+            )
+        elif backend == "local":
+            backend = LocalBackend()
+        self.backend = backend
+        app.extensions["mail_transport"] = self
+
+    def submit(self, message):
+        """Queues a Mailjet message dict; the returned Future resolves to its result."""
+        self._ensure_sender()
+        future = Future()
+        self._queue.put((message, future))
+        return future
+
+    def send(self, message):
+        """Sends a message and blocks until its batch completes; raises MailDeliveryError on failure."""
+        return self.submit(message).result(timeout=self.send_timeout)
+
+    def _ensure_sender(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="mail-transport", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < MAILJET_BATCH_LIMIT:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._send(batch)
+
+    def _send(self, batch):
+        messages = [message for message, _ in batch]
+        started = time.perf_counter()
+        try:
+            results = self.backend.send_batch(messages)
+        except Exception as e:
+            logger.warning("Mail batch of %d failed: %s", len(batch), e)
+            self._record(batches_failed=1, messages_failed=len(batch), started=started)
+            for _, future in batch:
+                future.set_exception(MailDeliveryError(str(e)))
+            return
+
+        failed = 0
+        for (_, future), result in zip(batch, results):
+            if result.get("Status") == "success":
+                future.set_result(result)
+            else:
+                failed += 1
+                future.set_exception(MailDeliveryError(str(result.get("Errors") or result)))
+        self._record(batches_sent=1, messages_sent=len(batch) - failed, messages_failed=failed, started=started)
+
+    def _record(self, started, **counts):
+        with self._metrics_lock:
+            for name, value in counts.items():
+                self.metrics[name] += value
+            self.metrics["send_seconds"] += time.perf_counter() - started
+
+    def stats(self):
+        with self._metrics_lock:
+            return dict(self.metrics, queued=self._queue.qsize())
+
+
+mail_transport = MailTransport()
+REGISTRY.add_collector(lambda: stats_gauges("bytemarket_mail", "Mail transport totals since start.", mail_transport.stats()))
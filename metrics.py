@@ -0,0 +1,318 @@
+import bisect
+import hmac
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from flask import Response, abort, current_app, g, has_request_context, request
+from sqlalchemy import event
+from werkzeug.middleware.profiler import ProfilerMiddleware
+
+# Request instrumentation exported in the Prometheus text format on /metrics,
+# which is only served when METRICS_TOKEN is set, to clients sending that token.
+# A WSGI middleware times every request end to end (including streamed bodies)
+# and counts in-flight requests and response bytes; SQLAlchemy engine events
+# count statements and database time per request and log slow statements;
+# track_external() times outbound Stripe and Mailjet calls. Sending
+# `X-Profile: 1` while PROFILING_ENABLED is set writes a cProfile dump of that
+# request to PROFILE_DIR.
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger(__name__ + ".slow_query")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# Keys in the WSGI environ shared between the Flask hooks and the middleware
+ENDPOINT_KEY = "bytemarket.endpoint"
+DB_STATS_KEY = "bytemarket.db_stats"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One slot per bucket plus +Inf, then the running sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts)) for key, counts in self._values.items()]
+        for key, counts in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", dict(labels, le=_format_value(float(bound))), cumulative
+            yield f"{self.name}_count", labels, cumulative
+            yield f"{self.name}_sum", labels, counts[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """Adds a callable that returns extra metrics (fresh Gauge/Counter objects) at scrape time."""
+        self._collectors.append(collect)
+
+    def render(self):
+        metrics = list(self._metrics)
+        for collect in self._collectors:
+            try:
+                metrics.extend(collect())
+            except Exception:
+                logger.exception("Metrics collector %r failed", collect)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "bytemarket_http_requests_total", "HTTP requests by route, method and status.", ("route", "method", "status")))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "bytemarket_http_request_duration_seconds", "Request latency including the response body.", ("route", "method")))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "bytemarket_http_requests_in_flight", "Requests currently being served."))
+HTTP_RESPONSE_BYTES = REGISTRY.register(Histogram(
+    "bytemarket_http_response_size_bytes", "Response body size.", ("route",), buckets=SIZE_BUCKETS))
+REQUEST_DB_QUERIES = REGISTRY.register(Histogram(
+    "bytemarket_http_request_db_queries", "SQL statements executed per request.", ("route",), buckets=QUERY_COUNT_BUCKETS))
+REQUEST_DB_SECONDS = REGISTRY.register(Histogram(
+    "bytemarket_http_request_db_seconds", "Time spent in SQL per request.", ("route",)))
+DB_QUERY_SECONDS = REGISTRY.register(Histogram(
+    "bytemarket_db_query_duration_seconds", "SQL statement latency by bind.", ("bind",)))
+DB_SLOW_QUERIES = REGISTRY.register(Counter(
+    "bytemarket_db_slow_queries_total", "SQL statements slower than SLOW_QUERY_SECONDS.", ("bind",)))
+EXTERNAL_LATENCY = REGISTRY.register(Histogram(
+    "bytemarket_external_call_duration_seconds", "Outbound API call latency.", ("service", "operation", "outcome")))
+
+
+@contextmanager
+def track_external(service, operation):
+    """Times an outbound API call, labelling it ok or error."""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        EXTERNAL_LATENCY.observe(time.perf_counter() - started, service=service, operation=operation, outcome=outcome)
+
+
+def stats_gauges(prefix, documentation, stats, label=None):
+    """Turns a stats() dict into gauges; nested dicts become values of `label`."""
+    gauges = {}
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            for name, inner in value.items():
+                if isinstance(inner, (int, float)):
+                    gauge = gauges.setdefault(name, Gauge(f"{prefix}_{name}", documentation, (label,)))
+                    gauge.inc(inner, **{label: key})
+        elif isinstance(value, (int, float)):
+            gauges.setdefault(key, Gauge(f"{prefix}_{key}", documentation)).inc(value)
+    return list(gauges.values())
+
+
+class _ClosingBody:
+    """Wraps a response iterable to count its bytes and finish timing when the server closes it."""
+
+    def __init__(self, body, on_close):
+        self._body = body
+        self._on_close = on_close
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self._body:
+            self.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self._body, "close"):
+                self._body.close()
+        finally:
+            self._on_close(self.size)
+
+
+class MetricsMiddleware:
+    def __init__(self, wsgi_app, profile_dir=None):
+        self.wsgi_app = wsgi_app
+        self.profiler = ProfilerMiddleware(wsgi_app, stream=None, profile_dir=profile_dir) if profile_dir else None
+
+    def __call__(self, environ, start_response):
+        started = time.perf_counter()
+        status = []
+
+        def capture_status(code, headers, exc_info=None):
+            status.append(code.split(" ", 1)[0])
+            return start_response(code, headers, exc_info)
+
+        def finish(size):
+            route = environ.get(ENDPOINT_KEY) or "unmatched"
+            method = environ.get("REQUEST_METHOD", "")
+            HTTP_IN_FLIGHT.dec()
+            HTTP_REQUESTS.inc(route=route, method=method, status=status[0] if status else "500")
+            HTTP_LATENCY.observe(time.perf_counter() - started, route=route, method=method)
+            HTTP_RESPONSE_BYTES.observe(size, route=route)
+            queries, seconds = environ.get(DB_STATS_KEY, (0, 0.0))
+            REQUEST_DB_QUERIES.observe(queries, route=route)
+            REQUEST_DB_SECONDS.observe(seconds, route=route)
+
+        HTTP_IN_FLIGHT.inc()
+        app = self.wsgi_app
+        if self.profiler is not None and environ.get("HTTP_X_PROFILE") == "1":
+            app = self.profiler
+        try:
+            body = app(environ, capture_status)
+        except Exception:
+            finish(0)
+            raise
+        return _ClosingBody(body, finish)
+
+
+class Instrumentation:
+    def __init__(self, app=None, db=None):
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        """Installs the middleware, SQL hooks and /metrics. Call after db.init_app()."""
+        app.config.setdefault("SLOW_QUERY_SECONDS", 0.1)
+        app.config.setdefault("METRICS_TOKEN", os.getenv("METRICS_TOKEN")) # Bearer token for /metrics; unset hides it
+        app.config.setdefault("PROFILING_ENABLED", os.getenv("PROFILING_ENABLED") == "1")
+        app.config.setdefault("PROFILE_DIR", os.path.join(app.instance_path, "profiles"))
+
+        profile_dir = None
+        if app.config["PROFILING_ENABLED"]:
+            profile_dir = app.config["PROFILE_DIR"]
+            os.makedirs(profile_dir, exist_ok=True)
+        app.wsgi_app = MetricsMiddleware(app.wsgi_app, profile_dir)
+        app.before_request(self._start_request)
+        self._install_sql_hooks(app, db)
+        app.add_url_rule("/metrics", "metrics", self._metrics_view)
+        app.extensions["instrumentation"] = self
+
+    def _start_request(self):
+        request.environ[ENDPOINT_KEY] = request.endpoint
+        g.db_stats = [0, 0.0]
+        request.environ[DB_STATS_KEY] = g.db_stats
+
+    def _install_sql_hooks(self, app, db):
+        threshold = app.config["SLOW_QUERY_SECONDS"]
+        with app.app_context():
+            engines = db.engines.items()
+        for key, engine in engines:
+            bind = key or "default"
+
+            @event.listens_for(engine, "before_cursor_execute")
+            def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+                conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+            @event.listens_for(engine, "after_cursor_execute")
+            def after_cursor_execute(conn, cursor, statement, parameters, context, executemany, bind=bind):
+                elapsed = time.perf_counter() - conn.info["query_started"].pop()
+                DB_QUERY_SECONDS.observe(elapsed, bind=bind)
+                if has_request_context() and "db_stats" in g:
+                    g.db_stats[0] += 1
+                    g.db_stats[1] += elapsed
+                if elapsed >= threshold:
+                    DB_SLOW_QUERIES.inc(bind=bind)
+                    slow_query_logger.warning("Slow query (%.1f ms on %s): %s", elapsed * 1000, bind, " ".join(statement.split())[:1000])
+
+            @event.listens_for(engine, "handle_error")
+            def handle_error(context):
+                # A failed statement never reaches after_cursor_execute
+                if context.connection is not None and context.connection.info.get("query_started"):
+                    context.connection.info["query_started"].pop()
+
+    def _metrics_view(self):
+        token = current_app.config["METRICS_TOKEN"]
+        if not token:
+            abort(404) # Route and latency data are never public
+        if not hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()):
+            abort(401)
+        return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,60 @@
+"""add product search index
+
+Revision ID: 3f2a9c1d7b10
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7b10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5(
+            product_name, description, category,
+            content='product', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS product_search_ai AFTER INSERT ON product BEGIN
+            INSERT INTO product_search(rowid, product_name, description, category)
+            VALUES (new.id, new.product_name, new.description, new.category);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS product_search_ad AFTER DELETE ON product BEGIN
+            INSERT INTO product_search(product_search, rowid, product_name, description, category)
+            VALUES ('delete', old.id, old.product_name, old.description, old.category);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS product_search_au AFTER UPDATE OF product_name, description, category ON product BEGIN
+            INSERT INTO product_search(product_search, rowid, product_name, description, category)
+            VALUES ('delete', old.id, old.product_name, old.description, old.category);
+            INSERT INTO product_search(rowid, product_name, description, category)
+            VALUES (new.id, new.product_name, new.description, new.category);
+        END
+    """)
+    # Backfill the index from the products that already exist
+    op.execute("INSERT INTO product_search(product_search) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute("DROP TRIGGER IF EXISTS product_search_au")
+    op.execute("DROP TRIGGER IF EXISTS product_search_ad")
+    op.execute("DROP TRIGGER IF EXISTS product_search_ai")
+    op.execute("DROP TABLE IF EXISTS product_search")
@@ -0,0 +1,44 @@
+"""unique cart item per product
+
+Revision ID: 7c41e0a2b9d3
+Revises: 3f2a9c1d7b10
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c41e0a2b9d3'
+down_revision = '3f2a9c1d7b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Merge duplicate lines into the oldest one before enforcing uniqueness
+    op.execute("""
+        UPDATE cart_item SET quantity = (
+            SELECT SUM(dup.quantity) FROM cart_item AS dup
+            WHERE dup.user_id = cart_item.user_id AND dup.product_id = cart_item.product_id
+        )
+        WHERE id IN (
+            SELECT MIN(id) FROM cart_item GROUP BY user_id, product_id HAVING COUNT(*) > 1
+        )
+    """)
+    op.execute("""
+        DELETE FROM cart_item WHERE id NOT IN (
+            SELECT keep.id FROM (
+                SELECT MIN(id) AS id FROM cart_item GROUP BY user_id, product_id
+            ) AS keep
+        )
+    """)
+    # Databases built by db.create_all() already have the index
+    indexes = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('cart_item')}
+    if 'uq_cart_item_user_product' not in indexes:
+        op.create_index('uq_cart_item_user_product', 'cart_item', ['user_id', 'product_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_cart_item_user_product', table_name='cart_item')
@@ -0,0 +1,49 @@
+"""add blob store and product file size
+
+Revision ID: a6d2e8f4c913
+Revises: f1c83d5e2b07
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d2e8f4c913'
+down_revision = 'f1c83d5e2b07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases built by db.create_all() may already have the column and table.
+    # Existing products keep their paths; only new uploads go to the blob store.
+    inspector = sa.inspect(op.get_bind())
+    if 'file_size' not in {column['name'] for column in inspector.get_columns('product')}:
+        with op.batch_alter_table('product', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('file_size', sa.BigInteger(), nullable=True))
+
+    if inspector.has_table('blob'):
+        return
+    op.create_table('blob',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('kind', sa.String(length=10), nullable=False),
+        sa.Column('path', sa.String(length=1024), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('path')
+    )
+    with op.batch_alter_table('blob', schema=None) as batch_op:
+        batch_op.create_index('uq_blob_sha256_kind', ['sha256', 'kind'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('blob', schema=None) as batch_op:
+        batch_op.drop_index('uq_blob_sha256_kind')
+    op.drop_table('blob')
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_column('file_size')
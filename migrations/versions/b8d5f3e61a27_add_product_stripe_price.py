@@ -0,0 +1,32 @@
+"""add product stripe price
+
+Revision ID: b8d5f3e61a27
+Revises: c5f0a3d8e614
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8d5f3e61a27'
+down_revision = 'c5f0a3d8e614'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases built by db.create_all() may already have the columns
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('product')}
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        if 'stripe_price_id' not in columns:
+            batch_op.add_column(sa.Column('stripe_price_id', sa.String(length=255), nullable=True))
+        if 'stripe_unit_amount' not in columns:
+            batch_op.add_column(sa.Column('stripe_unit_amount', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_column('stripe_unit_amount')
+        batch_op.drop_column('stripe_price_id')
@@ -0,0 +1,29 @@
+"""add product image variants
+
+Revision ID: c2e7a94f0d58
+Revises: b8d5f3e61a27
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2e7a94f0d58'
+down_revision = 'b8d5f3e61a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases built by db.create_all() may already have the column
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('product')}
+    if 'image_variants' not in columns:
+        with op.batch_alter_table('product', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('image_variants', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_column('image_variants')
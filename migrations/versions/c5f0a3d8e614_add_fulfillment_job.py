@@ -0,0 +1,47 @@
+"""add fulfillment job queue
+
+Revision ID: c5f0a3d8e614
+Revises: 7c41e0a2b9d3
+Create Date: 2026-10-18 11:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5f0a3d8e614'
+down_revision = '7c41e0a2b9d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases built by db.create_all() already have the table
+    if sa.inspect(op.get_bind()).has_table('fulfillment_job'):
+        return
+    op.create_table('fulfillment_job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('order_key', sa.String(length=255), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('recipient', sa.String(length=120), nullable=False),
+        sa.Column('file_paths', sa.JSON(), nullable=False),
+        sa.Column('items', sa.JSON(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('order_key')
+    )
+    with op.batch_alter_table('fulfillment_job', schema=None) as batch_op:
+        batch_op.create_index('ix_fulfillment_job_status_next_attempt', ['status', 'next_attempt_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('fulfillment_job', schema=None) as batch_op:
+        batch_op.drop_index('ix_fulfillment_job_status_next_attempt')
+    op.drop_table('fulfillment_job')
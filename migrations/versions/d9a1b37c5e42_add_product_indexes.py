@@ -0,0 +1,32 @@
+"""add product category and seller indexes
+
+Revision ID: d9a1b37c5e42
+Revises: c2e7a94f0d58
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9a1b37c5e42'
+down_revision = 'c2e7a94f0d58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases built by db.create_all() may already have the indexes
+    existing = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('product')}
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        if 'ix_product_category' not in existing:
+            batch_op.create_index('ix_product_category', ['category'], unique=False)
+        if 'ix_product_user_id' not in existing:
+            batch_op.create_index('ix_product_user_id', ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_user_id')
+        batch_op.drop_index('ix_product_category')
@@ -0,0 +1,51 @@
+"""add category facets and product price index
+
+Revision ID: f1c83d5e2b07
+Revises: e4b7c2a91f36
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c83d5e2b07'
+down_revision = 'e4b7c2a91f36'
+branch_labels = None
+depends_on = None
+
+# facets.PRICE_BUCKETS when this revision was written
+PRICE_BUCKETS = (0, 5, 10, 25, 50, 100, 250)
+
+
+def upgrade():
+    # Databases built by db.create_all() may already have the index and table
+    inspector = sa.inspect(op.get_bind())
+    existing = {index['name'] for index in inspector.get_indexes('product')}
+    if 'ix_product_category_price' not in existing:
+        with op.batch_alter_table('product', schema=None) as batch_op:
+            batch_op.create_index('ix_product_category_price', ['category', 'price'], unique=False)
+
+    if inspector.has_table('category_facet'):
+        return
+    op.create_table('category_facet',
+        sa.Column('category', sa.String(length=255), nullable=False),
+        sa.Column('bucket', sa.Integer(), nullable=False),
+        sa.Column('product_count', sa.Integer(), nullable=False),
+        sa.Column('min_price', sa.Float(), nullable=True),
+        sa.Column('max_price', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('category', 'bucket')
+    )
+    bucket = " ".join(f"WHEN price >= {low} THEN {index}" for index, low in reversed(list(enumerate(PRICE_BUCKETS))))
+    op.execute(
+        "INSERT INTO category_facet (category, bucket, product_count, min_price, max_price) "
+        f"SELECT category, CASE {bucket} ELSE 0 END AS bucket, count(*), min(price), max(price) "
+        "FROM product GROUP BY category, bucket"
+    )
+
+
+def downgrade():
+    op.drop_table('category_facet')
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_category_price')
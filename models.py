@@ -1,9 +1,15 @@
+from datetime import datetime, timezone
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from flask_bcrypt import Bcrypt
+from sqlalchemy import event
+from db_profile import RoutingSession
+from passwords import password_hasher
 
-db = SQLAlchemy()
-bcrypt = Bcrypt()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+def utcnow():
+    """Naive UTC timestamp, matching how SQLite stores DateTime columns."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -14,11 +20,11 @@ class User(db.Model, UserMixin):
     
     def set_password(self, password):
         """Hashes and sets the user's password."""
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
         """Checks if the entered password matches the stored hash."""
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return password_hasher.verify(password, self.password_hash)
 
     def __repr__(self):
         return f"User('{self.username}', '{self.email}')"
@@ -29,15 +35,63 @@ class Product(db.Model):
     description = db.Column(db.Text, nullable=False)
     price = db.Column(db.Float, nullable=False)
     image_path = db.Column(db.String(255)) 
+    image_variants = db.Column(db.JSON) # Resized/WebP derivatives by size, see images.py
     file_path = db.Column(db.String(1024))
-    category = db.Column(db.String(255), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False) # Link to the user who uploaded
+    file_size = db.Column(db.BigInteger) # Bytes, for files kept in the blob store
+    category = db.Column(db.String(255), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True) # Link to the user who uploaded
+    stripe_price_id = db.Column(db.String(255)) # Reusable Stripe Price for checkout
+    stripe_unit_amount = db.Column(db.Integer) # Amount in cents the Stripe Price was created with
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow) # Validator for the product page
 
     user = db.relationship('User', backref=db.backref('products', lazy=True)) # Establish relationship
 
+    # Price-filtered browsing and the facet slices in facets.py read this range
+    __table_args__ = (db.Index('ix_product_category_price', 'category', 'price'),)
+
     def __repr__(self):
         return f"Product('{self.product_name}', '${self.price}')"
     
+class CatalogVersion(db.Model):
+    """Single row bumped in the same transaction as any catalog change; see http_cache.py."""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+    def __repr__(self):
+        return f"CatalogVersion('{self.version}')"
+
+@event.listens_for(CatalogVersion.__table__, "after_create")
+def seed_catalog_version(table, connection, **kw):
+    # The row always exists so a bump is a plain UPDATE; migrated databases get it from e4b7c2a91f36
+    connection.execute(table.insert().values(id=1, version=0, updated_at=utcnow()))
+
+class Blob(db.Model):
+    """One stored copy of an uploaded file, shared by every product that uploads the same bytes; see storage.py."""
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), nullable=False)
+    kind = db.Column(db.String(10), nullable=False) # image or file
+    path = db.Column(db.String(1024), nullable=False, unique=True) # Relative to the storage root
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+    __table_args__ = (db.Index('uq_blob_sha256_kind', 'sha256', 'kind', unique=True),)
+
+    def __repr__(self):
+        return f"Blob('{self.path}', '{self.ref_count}')"
+
+class CategoryFacet(db.Model):
+    """Product count and price range per category and price bucket, kept current by facets.py."""
+    category = db.Column(db.String(255), primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True) # Index into facets.PRICE_BUCKETS
+    product_count = db.Column(db.Integer, nullable=False, default=0)
+    min_price = db.Column(db.Float)
+    max_price = db.Column(db.Float)
+
+    def __repr__(self):
+        return f"CategoryFacet('{self.category}', '{self.bucket}', '{self.product_count}')"
+
 class CartItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -47,6 +101,27 @@ class CartItem(db.Model):
     user = db.relationship('User', backref=db.backref('cart_items', lazy=True))
     product = db.relationship('Product', backref=db.backref('cart_items', lazy=True))
 
+    # One row per product in a user's cart; also the conflict target for upserts
+    __table_args__ = (db.Index('uq_cart_item_user_product', 'user_id', 'product_id', unique=True),)
+
     def __repr__(self):
         return f"CartItem('{self.product.product_name}', '{self.quantity}')"
-    
+
+class FulfillmentJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    order_key = db.Column(db.String(255), unique=True, nullable=False) # Idempotency key, e.g. the Stripe checkout session id
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    recipient = db.Column(db.String(120), nullable=False)
+    file_paths = db.Column(db.JSON, nullable=False, default=list)
+    items = db.Column(db.JSON, nullable=False, default=list) # Purchased lines, for re-rendering the thank-you page
+    status = db.Column(db.String(20), nullable=False, default='pending') # Statuses: pending, processing, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
+
+    __table_args__ = (db.Index('ix_fulfillment_job_status_next_attempt', 'status', 'next_attempt_at'),)
+
+    def __repr__(self):
+        return f"FulfillmentJob('{self.order_key}', '{self.status}')"
@@ -0,0 +1,179 @@
+import multiprocessing
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+import bcrypt
+
+# Password hashing off the request thread. bcrypt runs in a small process pool
+# so a burst of logins queues behind PASSWORD_HASH_WORKERS cores instead of
+# pinning every web worker, and at most PASSWORD_HASH_QUEUE hashes may be
+# pending at once; past that callers get HashingBusy straight away. The work
+# factor is BCRYPT_LOG_ROUNDS (the same setting Flask-Bcrypt used), and hashes
+# made with a different factor are upgraded on the next successful login.
+
+_ROUNDS_RE = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+
+class HashingBusy(Exception):
+    """The hashing pool is saturated; the client should retry later."""
+
+
+def _hash(password, rounds):
+    # Top-level so the process pool can pickle it
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _verify(password, password_hash):
+    try:
+        return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
+    except ValueError: # Not a bcrypt hash
+        return False
+
+
+def hash_rounds(password_hash):
+    """Returns the work factor a bcrypt hash was made with, or None if it isn't one."""
+    match = _ROUNDS_RE.match(password_hash or "")
+    return int(match.group(1)) if match else None
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.workers = 0
+        self.timeout = 10
+        self._slots = threading.BoundedSemaphore(1)
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("BCRYPT_LOG_ROUNDS", 12)
+        app.config.setdefault("PASSWORD_HASH_WORKERS", min(2, os.cpu_count() or 1)) # 0 hashes on the request thread
+        app.config.setdefault("PASSWORD_HASH_QUEUE", 16)
+        app.config.setdefault("PASSWORD_HASH_TIMEOUT", 10)
+        self.rounds = app.config["BCRYPT_LOG_ROUNDS"]
+        self.workers = app.config["PASSWORD_HASH_WORKERS"]
+        self.timeout = app.config["PASSWORD_HASH_TIMEOUT"]
+        self._slots = threading.BoundedSemaphore(app.config["PASSWORD_HASH_QUEUE"])
+        app.extensions["password_hasher"] = self
+
+    def _executor(self):
+        # Created on first use and again after a fork: pools don't survive into child processes
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    # spawn, because forking a threaded web worker can copy held locks
+                    context = multiprocessing.get_context("spawn")
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy("Too many password hashes in progress")
+        try:
+            return self._executor().submit(fn, *args).result(timeout=self.timeout)
+        except FutureTimeoutError as e:
+            raise HashingBusy("Password hashing timed out") from e
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        """Returns a bcrypt hash of `password` at the configured work factor."""
+        return self._run(_hash, password, self.rounds)
+
+    def verify(self, password, password_hash):
+        return self._run(_verify, password, password_hash)
+
+    def needs_rehash(self, password_hash):
+        return hash_rounds(password_hash) != self.rounds
+
+
+class AttemptLimiter:
+    """Counts attempts per key over a sliding window.
+
+    State lives in the worker process, so with N workers a client gets up to
+    N times the limit; it bounds CPU per worker, which is what it is for.
+    """
+
+    def __init__(self, limit, window, max_keys=10000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._attempts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _recent(self, key, now):
+        attempts = self._attempts.get(key)
+        if attempts is None:
+            return None
+        while attempts and attempts[0] <= now - self.window:
+            attempts.popleft()
+        if not attempts:
+            del self._attempts[key]
+            return None
+        return attempts
+
+    def blocked(self, key):
+        with self._lock:
+            attempts = self._recent(key, time.monotonic())
+            return attempts is not None and len(attempts) >= self.limit
+
+    def hit(self, key):
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._recent(key, now)
+            if attempts is None:
+                attempts = self._attempts[key] = deque(maxlen=self.limit)
+            attempts.append(now)
+            self._attempts.move_to_end(key)
+            while len(self._attempts) > self.max_keys:
+                self._attempts.popitem(last=False)
+
+    def reset(self, key):
+        with self._lock:
+            self._attempts.pop(key, None)
+
+
+class LoginThrottle:
+    """Limits password checks per client IP and failed logins per account."""
+
+    def __init__(self, app=None):
+        self.by_ip = AttemptLimiter(30, 300)
+        self.by_account = AttemptLimiter(5, 300)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("LOGIN_ATTEMPTS_PER_IP", 30)
+        app.config.setdefault("LOGIN_FAILURES_PER_ACCOUNT", 5)
+        app.config.setdefault("LOGIN_ATTEMPT_WINDOW", 300) # Seconds
+        window = app.config["LOGIN_ATTEMPT_WINDOW"]
+        self.by_ip = AttemptLimiter(app.config["LOGIN_ATTEMPTS_PER_IP"], window)
+        self.by_account = AttemptLimiter(app.config["LOGIN_FAILURES_PER_ACCOUNT"], window)
+        app.extensions["login_throttle"] = self
+
+    def allow(self, ip, account=None):
+        if self.by_ip.blocked(ip):
+            return False
+        return account is None or not self.by_account.blocked(account.lower())
+
+    def record(self, ip, account=None, success=True):
+        self.by_ip.hit(ip)
+        if account is None:
+            return
+        if success:
+            self.by_account.reset(account.lower())
+        else:
+            self.by_account.hit(account.lower())
+
+
+password_hasher = PasswordHasher()
+login_throttle = LoginThrottle()
@@ -0,0 +1,102 @@
+import sys
+import click
+from flask.cli import with_appcontext
+from models import db, User, Product, CartItem, CategoryFacet, FulfillmentJob, Blob, utcnow
+from cart_service import cart_statement, clear_cart_statement
+from fulfillment import claimable_condition, due_jobs_statement
+from facets import slice_statement
+from listings import PriceRange, category_statement, price_range_statement
+from search import fts_enabled, search_statement
+
+# Query-plan regression check for the queries behind the hot routes.
+# tests/test_query_plans.py runs EXPLAIN QUERY PLAN on each one against a
+# migrated database and fails if SQLite would read a table front to back, so a
+# dropped index or a rewritten query that no longer uses one is caught before
+# it reaches production. `flask check-query-plans` runs the same check against
+# a deployed database. Parameters are left NULL: SQLite picks the plan when
+# the statement is prepared.
+
+
+def hot_queries():
+    """Returns (name, statement, allow_scan) for every query a hot route runs."""
+    now = utcnow()
+    return [
+        ("product page", db.select(Product).where(Product.id == 1), False),
+        ("category page", category_statement("ebooks"), False),
+        ("category next page", category_statement("ebooks", after_id=1), False),
+        ("category by price", price_range_statement("ebooks", PriceRange(5, 20)), False),
+        ("category by price next page", price_range_statement("ebooks", PriceRange(5, 20), after=(9.99, 1)), False),
+        # The aggregate has a row per category and price bucket, so reading all of it is the point
+        ("browse facets", db.select(CategoryFacet), True),
+        ("facet slice", slice_statement("ebooks", 5, 20), False),
+        ("seller products", db.select(Product).where(Product.user_id == 1), False),
+        # The featured pool is meant to read every id, and the covering index keeps it cheap
+        ("featured pool", db.select(Product.id), True),
+        ("search", search_statement(), False),
+        ("search next page", search_statement(after=True), False),
+        ("load cart", cart_statement(1), False),
+        ("update cart line", db.update(CartItem).where(CartItem.id == 1, CartItem.user_id == 1).values(quantity=2), False),
+        ("remove cart line", db.delete(CartItem).where(CartItem.id == 1, CartItem.user_id == 1), False),
+        ("clear cart", clear_cart_statement(1), False),
+        ("login", db.select(User).where(User.email == "user@example.com"), False),
+        ("load user", db.select(User).where(User.id == 1), False),
+        ("fulfillment job", db.select(FulfillmentJob).where(FulfillmentJob.order_key == "order"), False),
+        ("due fulfillment jobs", due_jobs_statement(claimable_condition(now, now), 10), False),
+        ("blob reference", db.select(Blob.path).where(Blob.sha256 == "0" * 64, Blob.kind == "file"), False),
+        ("release blob", db.update(Blob).where(Blob.path == "files/x", Blob.ref_count > 0).values(ref_count=Blob.ref_count - 1), False),
+    ]
+
+
+def explain(conn, statement):
+    """Returns the detail column of each EXPLAIN QUERY PLAN row."""
+    compiled = statement.compile(dialect=conn.dialect)
+    params = (None,) * len(compiled.positiontup or ())
+    rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).all()
+    return [row[-1] for row in rows]
+
+
+def full_scans(plan):
+    # Virtual tables (the FTS index) report their own lookups as scans, and
+    # "SCAN (subquery-N)" / "SCAN CONSTANT ROW" read intermediate results, not tables
+    return [
+        step for step in plan
+        if step.startswith("SCAN ")
+        and not step.startswith(("SCAN (", "SCAN CONSTANT ROW"))
+        and "VIRTUAL TABLE" not in step
+    ]
+
+
+def check_query_plans(echo=click.echo):
+    """Explains every hot query; returns the names of those that scan a table."""
+    failures = []
+    with db.engine.connect() as conn:
+        for name, statement, allow_scan in hot_queries():
+            if name.startswith("search") and not fts_enabled():
+                continue
+            plan = explain(conn, statement)
+            scans = full_scans(plan)
+            failed = bool(scans) and not allow_scan
+            echo(f"{'FAIL' if failed else 'ok'}  {name}")
+            for step in plan:
+                echo(f"      {step}")
+            if failed:
+                failures.append(name)
+    return failures
+
+
+@click.command("check-query-plans")
+@with_appcontext
+def check_query_plans_command():
+    """Fails if any hot query falls back to a full table scan."""
+    if db.engine.dialect.name != "sqlite":
+        click.echo("Query plan checks only run against SQLite.")
+        return
+    failures = check_query_plans()
+    if failures:
+        click.echo(f"{len(failures)} query plan(s) scan a table: {', '.join(failures)}", err=True)
+        sys.exit(1)
+    click.echo("All query plans use an index.")
+
+
+def init_app(app):
+    app.cli.add_command(check_query_plans_command)
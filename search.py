@@ -0,0 +1,136 @@
+import re
+from sqlalchemy import Float, String, case, column, func, inspect, or_, text
+from models import db, Product
+from listings import LISTING_COLUMNS, PAGE_SIZE, Page, decode_cursor, paginate
+
+# Full-text product search backed by an SQLite FTS5 index.
+# The index is an external-content table over `product`, so it stores only the
+# tokenized terms; triggers keep it in sync with every insert and delete, and
+# with updates to the indexed columns (price or timestamp changes leave it alone).
+SEARCH_TABLE = "product_search"
+
+SEARCH_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5(
+        product_name, description, category,
+        content='product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_search_ai AFTER INSERT ON product BEGIN
+        INSERT INTO product_search(rowid, product_name, description, category)
+        VALUES (new.id, new.product_name, new.description, new.category);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_search_ad AFTER DELETE ON product BEGIN
+        INSERT INTO product_search(product_search, rowid, product_name, description, category)
+        VALUES ('delete', old.id, old.product_name, old.description, old.category);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_search_au AFTER UPDATE OF product_name, description, category ON product BEGIN
+        INSERT INTO product_search(product_search, rowid, product_name, description, category)
+        VALUES ('delete', old.id, old.product_name, old.description, old.category);
+        INSERT INTO product_search(rowid, product_name, description, category)
+        VALUES (new.id, new.product_name, new.description, new.category);
+    END
+    """,
+]
+
+# Column weights for bm25(): a hit in the name outranks one in the category,
+# which outranks one buried in the description.
+RANK_WEIGHTS = (10.0, 1.0, 5.0)
+
+# Search results carry a short description preview instead of the full text
+PREVIEW_LENGTH = 100
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_enabled():
+    return db.engine.dialect.name == "sqlite"
+
+
+def ensure_search_index():
+    """Creates the FTS index and its triggers, backfilling it if it is new."""
+    if not fts_enabled():
+        return
+    existed = inspect(db.engine).has_table(SEARCH_TABLE)
+    with db.engine.begin() as conn:
+        for statement in SEARCH_SCHEMA:
+            conn.exec_driver_sql(statement)
+        if not existed:
+            rebuild_search_index(conn)
+
+
+def rebuild_search_index(conn):
+    """Re-reads every product row into the index."""
+    conn.exec_driver_sql(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+
+
+def build_match_query(query):
+    """Turns free text into an FTS5 query where every word is a quoted prefix term."""
+    tokens = _TOKEN_RE.findall(query.lower())
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def search_catalog(query, cursor=None, limit=PAGE_SIZE):
+    """Returns one page of products matching `query`, best match first."""
+    if not fts_enabled():
+        return _search_like(query, cursor, limit)
+
+    match = build_match_query(query)
+    if not match:
+        return Page(items=())
+
+    params = {"match": match, "limit": limit + 1}
+    if cursor:
+        params["after_score"], params["after_id"] = decode_cursor(cursor, 2)
+    rows = db.session.execute(search_statement(after=bool(cursor)), params).all()
+    return paginate(rows, limit, key=lambda row: (row.score, row.id))
+
+
+def search_statement(after=False):
+    """The ranked FTS query; with `after`, it continues past :after_score/:after_id."""
+    weights = ", ".join(str(w) for w in RANK_WEIGHTS)
+    # bm25() scores are negative and lower is better, so ascending order is best first
+    keyset = "WHERE hits.score > :after_score OR (hits.score = :after_score AND hits.rowid > :after_id) " if after else ""
+    statement = text(
+        "SELECT product.id, product.product_name, product.price, product.image_path, product.image_variants, "
+        f"CASE WHEN length(product.description) > {PREVIEW_LENGTH} "
+        f"THEN substr(product.description, 1, {PREVIEW_LENGTH}) || '...' "
+        "ELSE product.description END AS description, "
+        "hits.score "
+        f"FROM (SELECT rowid, bm25({SEARCH_TABLE}, {weights}) AS score FROM {SEARCH_TABLE} "
+        f"WHERE {SEARCH_TABLE} MATCH :match) AS hits "
+        "JOIN product ON product.id = hits.rowid "
+        + keyset +
+        "ORDER BY hits.score, hits.rowid "
+        "LIMIT :limit"
+    )
+    return statement.columns(*LISTING_COLUMNS, column("description", String), column("score", Float))
+
+
+def _search_like(query, cursor, limit):
+    # Server databases get a plain substring match until they have their own index.
+    description = case(
+        (func.length(Product.description) > PREVIEW_LENGTH,
+         func.substr(Product.description, 1, PREVIEW_LENGTH) + "..."),
+        else_=Product.description,
+    ).label("description")
+    statement = (
+        db.select(*LISTING_COLUMNS, description)
+        .where(or_(
+            Product.product_name.icontains(query),
+            Product.description.icontains(query),
+            Product.category.icontains(query),
+        ))
+        .order_by(Product.id)
+        .limit(limit + 1)
+    )
+    if cursor:
+        (after_id,) = decode_cursor(cursor, 1)
+        statement = statement.where(Product.id > after_id)
+    return paginate(db.session.execute(statement).all(), limit, key=lambda row: (row.id,))
@@ -1,44 +1,40 @@
-import os, base64, mimetypes
-from mailjet_rest import Client
-from dotenv import load_dotenv
+import os
 from flask import current_app
+from downloads import download_url, file_location
+from attachments import attachment_cache
+from mail_transport import mail_transport
 
-load_dotenv()
+def send_email(recipient: str, file_paths: list[str], user_id: int | None = None):
+    # In "links" mode the email carries signed download links instead of the files
+    if current_app.config["DELIVERY_MODE"] == "links":
+        links = [url for url in (download_url(path, user_id) for path in file_paths) if url]
+        text_part = "Thank you for your purchase. Download your files here:\n\n" + "\n".join(links)
+        attachments = []
+    else:
+        text_part = "Thank you for sure purchase. Attached are your files!"
+        attachments = build_attachments(file_paths)
 
-def send_email(recipient: str, file_paths: list[str]):
-    mailjet = Client(auth=(os.getenv("MJ_APIKEY_PUBLIC"), os.getenv("MJ_APIKEY_SECRET")), version="v3.1")
-
-    attachments = []
-    for rel_path in file_paths:
-        full_path = os.path.join(current_app.static_folder, rel_path)
-        with open(full_path, 'rb') as f:
-            encoded = base64.b64encode(f.read()).decode()
-        attachments.append({
-            "ContentType": mimetypes.guess_type(full_path)[0] or "application/octet-stream",
-            "Filename": os.path.basename(full_path),
-            "Base64Content": encoded
-        })
-
-    data = {
-        'Messages': [
+    message = {
+        "From": {
+            "Email": "dylannguyen2331@gmail.com",
+            "Name": "ByteMarket"
+        },
+        "To": [
             {
-                "From": {
-                    "Email": "dylannguyen2331@gmail.com",
-                    "Name": "ByteMarket"
-                },
-                "To": [
-                    {
-                        "Email": recipient,
-                        "Name": recipient
-                    }
-                ],
-                "Subject": "Thank you for your purchase at ByteMarket!",
-                "TextPart": "Thank you for sure purchase. Attached are your files!",
-                "Attachments": attachments
+                "Email": recipient,
+                "Name": recipient
             }
-        ]
+        ],
+        "Subject": "Thank you for your purchase at ByteMarket!",
+        "TextPart": text_part,
+        "Attachments": attachments
     }
 
-    result = mailjet.send.create(data=data)
-    print(result.status_code)
-    print(result.json())
\ No newline at end of file
+    # Batched with other queued messages; raises MailDeliveryError if Mailjet rejects it
+    return mail_transport.send(message)
+
+def build_attachments(file_paths: list[str]):
+    return [
+        attachment_cache.attachment(os.path.join(*file_location(rel_path)))
+        for rel_path in file_paths
+    ]
@@ -49,7 +49,7 @@ document.addEventListener('DOMContentLoaded', () => {
       cartHTML += `
         <div class="cart-item" data-item-id="${item.id}">
           <div class="cart-item-image">
-            <img src="/static/${item.image_path}" alt="${item.name}">
+            <img src="${item.thumbnail_url}" alt="${item.name}">
           </div>
           <div class="cart-item-info">
             <h3>${item.name}</h3>
@@ -96,6 +96,94 @@ document.addEventListener('DOMContentLoaded', () => {
     }
   }
   
+  // Pending quantity changes and removals, sent together as one batch
+  const BATCH_DELAY_MS = 400;
+  let pendingQuantities = {};
+  let pendingRemovals = new Set();
+  let batchTimer = null;
+
+  function scheduleBatch() {
+    clearTimeout(batchTimer);
+    batchTimer = setTimeout(flushBatch, BATCH_DELAY_MS);
+  }
+
+  // Empties the pending changes into a list of batch operations
+  function takeOperations() {
+    clearTimeout(batchTimer);
+    batchTimer = null;
+    const operations = [];
+    Object.entries(pendingQuantities).forEach(([itemId, quantity]) => {
+      if (!pendingRemovals.has(itemId)) {
+        operations.push({ op: 'update', item_id: itemId, quantity: quantity });
+      }
+    });
+    pendingRemovals.forEach(itemId => {
+      operations.push({ op: 'remove', item_id: itemId });
+    });
+    pendingQuantities = {};
+    pendingRemovals = new Set();
+    return operations;
+  }
+
+  async function flushBatch() {
+    const operations = takeOperations();
+    if (operations.length === 0) {
+      return;
+    }
+
+    try {
+      const response = await fetch('/api/cart/batch', {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ operations: operations })
+      });
+
+      const data = await response.json();
+
+      if (data.success) {
+        renderCartItems(data.cart_items);
+        updateCheckoutButton(data.cart_items);
+      } else {
+        console.error('Error updating cart:', data.message);
+        loadCartItems();
+      }
+    } catch (error) {
+      console.error('Error:', error);
+      loadCartItems();
+    }
+  }
+
+  // Save pending changes before going to the payment page
+  const checkoutLink = checkoutButton ? checkoutButton.closest('a') : null;
+  if (checkoutLink) {
+    checkoutLink.addEventListener('click', async (event) => {
+      if (batchTimer === null) {
+        return;
+      }
+      event.preventDefault();
+      await flushBatch();
+      window.location.href = checkoutLink.href;
+    });
+  }
+
+  // The page may be unloaded before the timer fires; keepalive lets the request outlive it
+  window.addEventListener('pagehide', () => {
+    const operations = takeOperations();
+    if (operations.length === 0) {
+      return;
+    }
+    fetch('/api/cart/batch', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json'
+      },
+      body: JSON.stringify({ operations: operations }),
+      keepalive: true
+    });
+  });
+
   // Cart update handling
   function addCartItemEventListeners() {
     // Get all cart items
@@ -107,77 +195,29 @@ document.addEventListener('DOMContentLoaded', () => {
       const increaseBtn = item.querySelector('.increase');
       const removeBtn = item.querySelector('.remove-item-btn');
       const quantityElement = item.querySelector('.quantity');
+
+      // Update the UI right away; the server sees the final quantity only
+      function changeQuantity(delta) {
+        const newQuantity = parseInt(quantityElement.textContent) + delta;
+        if (newQuantity < 1) {
+          return;
+        }
+        quantityElement.textContent = newQuantity;
+        pendingQuantities[itemId] = newQuantity;
+        scheduleBatch();
+      }
       
       // Decrease button handling
-      decreaseBtn.addEventListener('click', async () => {
-        let currentQuantity = parseInt(quantityElement.textContent);
-        if (currentQuantity > 1) {
-          try {
-            const response = await fetch(`/api/cart/update/${itemId}`, {
-              method: 'POST',
-              headers: {
-                'Content-Type': 'application/json'
-              },
-              body: JSON.stringify({ quantity: currentQuantity - 1 })
-            });
-            
-            const data = await response.json();
-            
-            if (data.success) {
-              // Update the UI
-              loadCartItems();
-            } else {
-              console.error('Error updating quantity:', data.message);
-            }
-          } catch (error) {
-            console.error('Error:', error);
-          }
-        }
-      });
+      decreaseBtn.addEventListener('click', () => changeQuantity(-1));
       
       // Increase button handling
-      increaseBtn.addEventListener('click', async () => {
-        let currentQuantity = parseInt(quantityElement.textContent);
-        try {
-          const response = await fetch(`/api/cart/update/${itemId}`, {
-            method: 'POST',
-            headers: {
-              'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({ quantity: currentQuantity + 1 })
-          });
-          
-          const data = await response.json();
-          
-          if (data.success) {
-            // Update the UI
-            loadCartItems();
-          } else {
-            console.error('Error updating quantity:', data.message);
-          }
-        } catch (error) {
-          console.error('Error:', error);
-        }
-      });
+      increaseBtn.addEventListener('click', () => changeQuantity(1));
       
       // Remove button handling
-      removeBtn.addEventListener('click', async () => {
-        try {
-          const response = await fetch(`/api/cart/remove/${itemId}`, {
-            method: 'DELETE'
-          });
-          
-          const data = await response.json();
-          
-          if (data.success) {
-            // Update the UI
-            loadCartItems();
-          } else {
-            console.error('Error removing item:', data.message);
-          }
-        } catch (error) {
-          console.error('Error:', error);
-        }
+      removeBtn.addEventListener('click', () => {
+        item.style.display = 'none';
+        pendingRemovals.add(itemId);
+        scheduleBatch();
       });
     });
   }
@@ -0,0 +1,44 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const statusElement = document.getElementById('fulfillment-status');
+    if (!statusElement) {
+        return;
+    }
+
+    const orderKey = statusElement.dataset.orderKey;
+    const statusText = statusElement.querySelector('.status-text');
+    const POLL_INTERVAL_MS = 3000;
+    const labels = {
+        pending: 'Preparing your email...',
+        processing: 'Sending your email...',
+        sent: 'Email sent!',
+        failed: 'We could not send your email. Please contact support.'
+    };
+
+    function showStatus(status) {
+        statusText.textContent = labels[status] || status;
+    }
+
+    // Poll until the delivery reaches a final state
+    function pollStatus() {
+        fetch(`/api/fulfillment/${encodeURIComponent(orderKey)}`)
+            .then(response => response.json())
+            .then(data => {
+                if (!data.success) {
+                    return;
+                }
+                showStatus(data.status);
+                if (data.status !== 'sent' && data.status !== 'failed') {
+                    setTimeout(pollStatus, POLL_INTERVAL_MS);
+                }
+            })
+            .catch(error => {
+                console.error('Error:', error);
+                setTimeout(pollStatus, POLL_INTERVAL_MS);
+            });
+    }
+
+    showStatus(statusElement.dataset.status);
+    if (statusElement.dataset.status !== 'sent' && statusElement.dataset.status !== 'failed') {
+        setTimeout(pollStatus, POLL_INTERVAL_MS);
+    }
+});
@@ -1,6 +1,76 @@
 document.addEventListener('DOMContentLoaded', function() {
+    let pageObserver = null;
+
+    // The category endpoint returns the URL of the next page in a Link header
+    function nextPageUrl(response) {
+        const match = /<([^>]+)>;\s*rel="next"/.exec(response.headers.get('Link') || '');
+        return match ? match[1] : null;
+    }
+
+    // Appends the next page of cards whenever the end of the grid scrolls into view
+    function loadMoreOnScroll(grid, nextUrl) {
+        if (pageObserver) {
+            pageObserver.disconnect();
+            pageObserver = null;
+        }
+        if (!grid || !nextUrl) {
+            return;
+        }
+
+        const sentinel = document.createElement('div');
+        sentinel.className = 'page-sentinel';
+        grid.after(sentinel);
+        let loading = false;
+
+        pageObserver = new IntersectionObserver(entries => {
+            if (!entries[0].isIntersecting || loading || !nextUrl) {
+                return;
+            }
+            loading = true;
+            fetch(nextUrl)
+                .then(response => response.text().then(data => ({ data, url: nextPageUrl(response) })))
+                .then(({ data, url }) => {
+                    grid.insertAdjacentHTML('beforeend', data);
+                    nextUrl = url;
+                    loading = false;
+                    if (!nextUrl) {
+                        pageObserver.disconnect();
+                        sentinel.remove();
+                    }
+                })
+                .catch(error => {
+                    loading = false;
+                    console.error('Error:', error);
+                });
+        }, { rootMargin: '400px' });
+        pageObserver.observe(sentinel);
+    }
+
     const categoryLinks = document.querySelectorAll('.categories .category-item a');
 
+    // Product counts next to each category, from the facet aggregate
+    if (categoryLinks.length) {
+        fetch('/api/facets')
+            .then(response => response.json())
+            .then(data => {
+                if (!data.success) {
+                    return;
+                }
+                const counts = new Map(data.categories.map(facet => [facet.name, facet.count]));
+                categoryLinks.forEach(link => {
+                    const count = counts.get(link.getAttribute('href').split('/').pop());
+                    const label = link.querySelector('.category-label');
+                    if (label && count !== undefined) {
+                        const badge = document.createElement('span');
+                        badge.className = 'category-count';
+                        badge.textContent = ` (${count})`;
+                        label.appendChild(badge);
+                    }
+                });
+            })
+            .catch(error => console.error('Error:', error));
+    }
+
     categoryLinks.forEach(link => {
         link.addEventListener('click', function(event) {
             event.preventDefault();
@@ -9,8 +79,8 @@ document.addEventListener('DOMContentLoaded', function() {
             const originalContent = mainContent.innerHTML;
 
             fetch(`/category/${category}`)
-                .then(response => response.text())
-                .then(data => {
+                .then(response => response.text().then(data => ({ data, nextUrl: nextPageUrl(response) })))
+                .then(({ data, nextUrl }) => {
                     const productsSection = document.querySelector('.products');
                     productsSection.innerHTML = data;
                     const categoryHeader = document.getElementById('category-header');
@@ -29,6 +99,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     }
                     
                     categoryHeader.textContent = categoryName;
+                    loadMoreOnScroll(productsSection.querySelector('.placeholder-products'), nextUrl);
                 })
                 .catch(error => {
                     console.error('Error:', error);
@@ -4,17 +4,38 @@ document.addEventListener('DOMContentLoaded', function() {
     const searchButton = searchForm.querySelector('.search-button');
     const mainContent = document.querySelector('main');
     const originalContent = mainContent.innerHTML; // Store original content
+    let pageObserver = null;
+    
+    function searchUrl(query, cursor) {
+        let url = `/api/search?q=${encodeURIComponent(query)}`;
+        if (cursor) {
+            url += `&cursor=${encodeURIComponent(cursor)}`;
+        }
+        return url;
+    }
+    
+    function resultCards(results) {
+        return results.map(product => `
+                    <a href="/product/${product.id}">
+                        <div class="placeholder-product">
+                            <img src="/static/${product.thumbnail_path}" alt="${product.name}" loading="lazy">
+                        </div>
+                        <h4>${product.name}</h4>
+                        <p class="product-price">$${product.price.toFixed(2)}</p>
+                    </a>
+                `).join('');
+    }
     
     function performSearch(query) {
         // Show loading state
         mainContent.innerHTML = '<div class="loading">Searching...</div>';
         
         // Fetch search results
-        fetch(`/api/search?q=${encodeURIComponent(query)}`)
+        fetch(searchUrl(query))
             .then(response => response.json())
             .then(data => {
                 if (data.success) {
-                    displaySearchResults(data.results, query);
+                    displaySearchResults(data.results, query, data.next_cursor);
                 } else {
                     mainContent.innerHTML = `<div class="search-error">${data.message}</div>`;
                 }
@@ -26,7 +47,11 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     
     // Display search results
-    function displaySearchResults(results, query) {
+    function displaySearchResults(results, query, nextCursor) {
+        if (pageObserver) {
+            pageObserver.disconnect();
+            pageObserver = null;
+        }
         if (results.length === 0) {
             mainContent.innerHTML = `
                 <section class="search-results">
@@ -41,30 +66,22 @@ document.addEventListener('DOMContentLoaded', function() {
             let resultsHTML = `
                 <section class="search-results">
                     <div class="products-container">
-                        <h3>Search Results for "${query}" (${results.length} items)</h3>
+                        <h3>Search Results for "${query}"</h3>
                         <button class="clear-search-btn">Back to Home</button>
                         <div class="placeholder-products">
             `;
             
-            results.forEach(product => {
-                resultsHTML += `
-                    <a href="/product/${product.id}">
-                        <div class="placeholder-product">
-                            <img src="/static/${product.image_path}" alt="${product.name}">
-                        </div>
-                        <h4>${product.name}</h4>
-                        <p class="product-price">$${product.price.toFixed(2)}</p>
-                    </a>
-                `;
-            });
+            resultsHTML += resultCards(results);
             
             resultsHTML += `
                         </div>
+                        <div class="page-sentinel"></div>
                     </div>
                 </section>
             `;
             
             mainContent.innerHTML = resultsHTML;
+            loadMoreOnScroll(query, nextCursor);
         }
         
         // Back to Home button
@@ -77,10 +94,113 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    // Fetches the next page of results whenever the end of the list scrolls into view
+    function loadMoreOnScroll(query, cursor) {
+        const grid = mainContent.querySelector('.search-results .placeholder-products');
+        const sentinel = mainContent.querySelector('.search-results .page-sentinel');
+        if (!cursor) {
+            sentinel.remove();
+            return;
+        }
+        let loading = false;
+        
+        pageObserver = new IntersectionObserver(entries => {
+            if (!entries[0].isIntersecting || loading || !cursor) {
+                return;
+            }
+            loading = true;
+            fetch(searchUrl(query, cursor))
+                .then(response => response.json())
+                .then(data => {
+                    loading = false;
+                    if (!data.success) {
+                        return;
+                    }
+                    grid.insertAdjacentHTML('beforeend', resultCards(data.results));
+                    cursor = data.next_cursor;
+                    if (!cursor) {
+                        pageObserver.disconnect();
+                        sentinel.remove();
+                    }
+                })
+                .catch(error => {
+                    loading = false;
+                    console.error('Search error:', error);
+                });
+        }, { rootMargin: '400px' });
+        pageObserver.observe(sentinel);
+    }
+    
+    // Typeahead suggestions, fetched as the user types
+    const suggestionList = document.createElement('ul');
+    suggestionList.className = 'search-suggestions';
+    suggestionList.hidden = true;
+    searchForm.appendChild(suggestionList);
+    let suggestTimer = null;
+    let suggestRequest = 0;
+    
+    function hideSuggestions() {
+        suggestionList.hidden = true;
+        suggestionList.innerHTML = '';
+    }
+    
+    function showSuggestions(suggestions) {
+        suggestionList.innerHTML = '';
+        suggestions.forEach(suggestion => {
+            const item = document.createElement('li');
+            item.textContent = suggestion.label;
+            if (suggestion.type === 'category') {
+                item.classList.add('suggestion-category');
+            }
+            // mousedown fires before the input's blur hides the list
+            item.addEventListener('mousedown', function(e) {
+                e.preventDefault();
+                hideSuggestions();
+                if (suggestion.type === 'product') {
+                    window.location.href = `/product/${suggestion.id}`;
+                } else {
+                    searchInput.value = suggestion.label;
+                    performSearch(suggestion.label);
+                }
+            });
+            suggestionList.appendChild(item);
+        });
+        suggestionList.hidden = suggestions.length === 0;
+    }
+    
+    searchInput.addEventListener('input', function() {
+        clearTimeout(suggestTimer);
+        const query = searchInput.value.trim();
+        if (!query) {
+            hideSuggestions();
+            return;
+        }
+        suggestTimer = setTimeout(() => {
+            // Responses can arrive out of order; only the latest one is shown
+            const requestId = ++suggestRequest;
+            fetch(`/api/suggest?q=${encodeURIComponent(query)}`)
+                .then(response => response.json())
+                .then(data => {
+                    if (requestId === suggestRequest && data.success) {
+                        showSuggestions(data.suggestions);
+                    }
+                })
+                .catch(error => console.error('Suggest error:', error));
+        }, 80);
+    });
+    
+    searchInput.addEventListener('blur', hideSuggestions);
+    searchInput.addEventListener('keydown', function(e) {
+        if (e.key === 'Escape') {
+            hideSuggestions();
+        }
+    });
+    
     // Event listeners for search
     searchForm.addEventListener('submit', function(e) {
         e.preventDefault();
         const query = searchInput.value.trim();
+        hideSuggestions();
         if (query) {
             performSearch(query);
         }
@@ -89,6 +209,7 @@ document.addEventListener('DOMContentLoaded', function() {
     searchButton.addEventListener('click', function(e) {
         e.preventDefault();
         const query = searchInput.value.trim();
+        hideSuggestions();
         if (query) {
             performSearch(query);
         }
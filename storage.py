@@ -0,0 +1,288 @@
+import hashlib
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy.dialects import postgresql, sqlite
+from werkzeug.utils import secure_filename
+from models import db, Blob
+from metrics import REGISTRY, stats_gauges
+
+# Content-addressed storage for uploaded product images and purchasable files.
+# An upload is first staged: streamed to a staging file in STORAGE_CHUNK_SIZE
+# chunks while it is hashed, without touching the database, so no upload is
+# ever held in memory and slow work on it (image processing) happens before any
+# write transaction starts. Committing a staged blob then takes a reference in
+# the current session and moves the file into place. Each distinct content (per
+# kind) is stored once, under a path derived from its SHA-256, and the blob
+# table counts the products referring to it: a second upload of the same bytes
+# only takes another reference and its staged copy is dropped.
+#
+# Images are public and live under the static folder, so their URLs work
+# unchanged. Purchasable files live under STORAGE_ROOT, outside the static
+# folder, and are only reachable through the signed download route and email
+# attachments. Files keep their original (sanitized) name as the last path
+# component, which is what download links and attachments are named after.
+# Blobs whose count drops to zero are deleted by `flask storage gc`.
+
+IMAGE_PREFIX = "product_images/blobs" # Under the static folder
+FILE_PREFIX = "files" # Under STORAGE_ROOT; listed in downloads.DOWNLOAD_DIRECTORIES
+STAGING_FOLDER = ".staging" # Inside each prefix, so gc sweeps abandoned uploads
+
+BLOB_KINDS = ("image", "file")
+
+_UPSERT_DIALECTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+_blobs = Blob.__table__
+
+
+class BlobTooLarge(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class StagedBlob:
+    kind: str
+    filename: str
+    staged: str # Local file holding the upload until it is committed or discarded
+    size: int
+    sha256: str
+
+    @property
+    def path(self):
+        """Where the blob is stored, unless the same content is stored already."""
+        return blob_path(self.kind, self.sha256, self.filename)
+
+
+@dataclass(frozen=True)
+class StoredBlob:
+    path: str
+    size: int
+    sha256: str
+
+
+class LocalBackend:
+    """Keeps images under `public_root` and files under `private_root`."""
+
+    def __init__(self, public_root, private_root):
+        self.public_root = public_root
+        self.private_root = private_root
+
+    def _root(self, path):
+        return self.private_root if is_private(path) else self.public_root
+
+    def _full(self, path):
+        return os.path.join(self._root(path), *path.split("/"))
+
+    def locate(self, path):
+        """Returns (directory, relative path) of the file at `path`."""
+        return self._root(path), path
+
+    def stage(self, prefix):
+        """Returns (binary file, staging name) for a new upload that will be published under `prefix`."""
+        folder = self._full(f"{prefix}/{STAGING_FOLDER}")
+        os.makedirs(folder, exist_ok=True)
+        fd, name = tempfile.mkstemp(dir=folder)
+        return os.fdopen(fd, "wb"), name
+
+    def publish(self, staged, path):
+        target = self._full(path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(staged, target) # Atomic, so readers never see a partial file
+
+    def discard(self, staged):
+        try:
+            os.remove(staged)
+        except FileNotFoundError:
+            pass
+
+    def exists(self, path):
+        return os.path.isfile(self._full(path))
+
+    def delete(self, path):
+        self.discard(self._full(path))
+
+    def list(self, prefix):
+        """Yields (path, modified time) of every file under `prefix`."""
+        root = self._root(prefix)
+        for folder, _, files in os.walk(self._full(prefix)):
+            for name in files:
+                full = os.path.join(folder, name)
+                yield os.path.relpath(full, root).replace(os.sep, "/"), os.path.getmtime(full)
+
+
+_BACKENDS = {"local": lambda app: LocalBackend(app.static_folder, app.config["STORAGE_ROOT"])}
+
+
+def is_private(path):
+    return path.split("/", 1)[0] == FILE_PREFIX
+
+
+def blob_path(kind, sha256, filename):
+    if kind == "image":
+        extension = os.path.splitext(secure_filename(filename))[1].lower()
+        return f"{IMAGE_PREFIX}/{sha256[:2]}/{sha256}{extension}"
+    return f"{FILE_PREFIX}/{sha256[:2]}/{sha256}/{secure_filename(filename) or sha256}"
+
+
+class BlobStore:
+    def __init__(self, app=None):
+        self.backend = None
+        self.chunk_size = 1024 * 1024
+        self.max_bytes = None
+        self.stored = 0
+        self.deduplicated = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("STORAGE_BACKEND", "local") # Only the local filesystem so far
+        app.config.setdefault("STORAGE_ROOT", os.path.join(app.instance_path, "storage")) # Purchasable files; never under the static folder
+        app.config.setdefault("STORAGE_CHUNK_SIZE", 1024 * 1024)
+        app.config.setdefault("STORAGE_MAX_BYTES", 1024 * 1024 * 1024) # Per upload; None for no limit
+        backend = app.config["STORAGE_BACKEND"]
+        if backend not in _BACKENDS:
+            raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}; expected one of {', '.join(_BACKENDS)}")
+        self.backend = _BACKENDS[backend](app)
+        self.chunk_size = app.config["STORAGE_CHUNK_SIZE"]
+        self.max_bytes = app.config["STORAGE_MAX_BYTES"]
+        app.extensions["blob_store"] = self
+        app.cli.add_command(storage_cli)
+
+    def _stream(self, stream, prefix):
+        """Copies `stream` to a staging file; returns (staging name, size, sha256)."""
+        digest = hashlib.sha256()
+        size = 0
+        f, staged = self.backend.stage(prefix)
+        try:
+            with f:
+                for chunk in iter(lambda: stream.read(self.chunk_size), b""):
+                    size += len(chunk)
+                    if self.max_bytes is not None and size > self.max_bytes:
+                        raise BlobTooLarge(f"Uploads are limited to {self.max_bytes} bytes")
+                    digest.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            self.backend.discard(staged)
+            raise
+        return staged, size, digest.hexdigest()
+
+    def _reference(self, sha256, kind, path, size):
+        """Takes a reference on the blob, creating its row if needed; returns the path it is stored at."""
+        conn = db.session.connection()
+        insert = _UPSERT_DIALECTS.get(conn.dialect.name)
+        key = (_blobs.c.sha256 == sha256) & (_blobs.c.kind == kind)
+        if insert is None:
+            updated = conn.execute(_blobs.update().where(key).values(ref_count=_blobs.c.ref_count + 1))
+            if not updated.rowcount:
+                conn.execute(_blobs.insert().values(sha256=sha256, kind=kind, path=path, size=size, ref_count=1))
+        else:
+            statement = insert(_blobs).values(sha256=sha256, kind=kind, path=path, size=size, ref_count=1)
+            conn.execute(statement.on_conflict_do_update(
+                index_elements=[_blobs.c.sha256, _blobs.c.kind],
+                set_={"ref_count": _blobs.c.ref_count + 1},
+            ))
+        # The first upload of this content chose the path
+        return conn.execute(db.select(_blobs.c.path).where(key)).scalar_one()
+
+    def stage(self, stream, filename, kind):
+        """Copies the contents of `stream` to a staging file; returns a StagedBlob.
+
+        Touches no database, so it is safe to call before a write transaction.
+        The caller commits or discards the result.
+        """
+        if kind not in BLOB_KINDS:
+            raise ValueError(f"kind must be one of {', '.join(BLOB_KINDS)}")
+        prefix = IMAGE_PREFIX if kind == "image" else FILE_PREFIX
+        staged, size, sha256 = self._stream(stream, prefix)
+        return StagedBlob(kind=kind, filename=filename, staged=staged, size=size, sha256=sha256)
+
+    def commit(self, blob):
+        """Takes a reference on a StagedBlob and moves it into place; returns a StoredBlob.
+
+        The reference is written in the current session, so it commits or
+        rolls back with the product that uses it. A rolled-back blob's file is
+        left for `flask storage gc`.
+        """
+        try:
+            path = self._reference(blob.sha256, blob.kind, blob.path, blob.size)
+            if self.backend.exists(path):
+                self.backend.discard(blob.staged)
+                self.deduplicated += 1
+            else:
+                self.backend.publish(blob.staged, path)
+                self.stored += 1
+        except BaseException:
+            self.backend.discard(blob.staged)
+            raise
+        return StoredBlob(path=path, size=blob.size, sha256=blob.sha256)
+
+    def discard(self, blob):
+        """Drops a StagedBlob that won't be committed; None is ignored."""
+        if blob is not None:
+            self.backend.discard(blob.staged)
+
+    def locate(self, path):
+        """Returns (directory, relative path) of the stored file at `path`."""
+        return self.backend.locate(path)
+
+    def release(self, path):
+        """Drops one reference on the blob at `path`; paths outside the store are ignored."""
+        if path:
+            db.session.execute(
+                _blobs.update()
+                .where(_blobs.c.path == path, _blobs.c.ref_count > 0)
+                .values(ref_count=_blobs.c.ref_count - 1)
+            )
+
+    def _unused(self):
+        """Returns {id: path} of the blobs no product refers to."""
+        return dict(db.session.execute(db.select(_blobs.c.id, _blobs.c.path).where(_blobs.c.ref_count <= 0)).all())
+
+    def collect(self, grace_seconds=3600):
+        """Deletes unreferenced blobs and stray files older than `grace_seconds`; returns how many files went."""
+        unused = self._unused()
+        removed = 0
+        if unused:
+            # Re-checked in the delete, since an upload may have referenced a
+            # blob again since it was selected. The files go before the commit:
+            # the delete holds the write lock, so no upload can reference them
+            # in between.
+            db.session.execute(_blobs.delete().where(_blobs.c.ref_count <= 0, _blobs.c.id.in_(unused)))
+            kept = set(db.session.execute(db.select(_blobs.c.id).where(_blobs.c.id.in_(unused))).scalars())
+            for blob_id, path in unused.items():
+                if blob_id not in kept:
+                    self.backend.delete(path)
+                    removed += 1
+        db.session.commit()
+
+        # Leftovers of uploads that failed, or that lost a race to store the same content
+        known = set(db.session.execute(db.select(_blobs.c.path)).scalars())
+        cutoff = time.time() - grace_seconds
+        for prefix in (IMAGE_PREFIX, FILE_PREFIX):
+            for path, modified in self.backend.list(prefix):
+                if path not in known and modified < cutoff:
+                    self.backend.delete(path)
+                    removed += 1
+        return removed
+
+    def stats(self):
+        return {"stored": self.stored, "deduplicated": self.deduplicated}
+
+
+blob_store = BlobStore()
+REGISTRY.add_collector(lambda: stats_gauges("bytemarket_storage", "Uploads stored and deduplicated.", blob_store.stats()))
+
+
+storage_cli = AppGroup("storage", help="Manage stored product images and files.")
+
+
+@storage_cli.command("gc")
+@click.option("--grace", default=3600, show_default=True, help="Seconds before an unreferenced file may be removed.")
+def gc_command(grace):
+    """Deletes blobs no product refers to."""
+    removed = current_app.extensions["blob_store"].collect(grace)
+    click.echo(f"Removed {removed} stored file(s).")
@@ -0,0 +1,154 @@
+import logging
+import os
+import click
+from flask.cli import with_appcontext
+from models import db, Product
+from metrics import track_external
+
+# Keeps a Stripe Price for every product so checkout only sends price ids, and
+# owns the Stripe client: one pooled keep-alive session with explicit timeouts
+# and bounded retries. STRIPE_API_BASE points it at a local stripe-mock server.
+# The stripe package takes about a second to import, so it is only loaded when
+# the first Stripe call is made.
+
+logger = logging.getLogger(__name__)
+
+
+class CheckoutUnavailable(Exception):
+    """Stripe rejected our credentials, so checkout can't start."""
+
+
+def unit_amount(price):
+    """Converts a dollar price to Stripe's integer cents."""
+    return int(round(price * 100))
+
+
+class StripeCatalog:
+    def __init__(self, app=None):
+        self.app = None
+        self._client = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("STRIPE_SECRET_KEY", os.getenv("STRIPE_SECRET_KEY"))
+        app.config.setdefault("STRIPE_API_BASE", os.getenv("STRIPE_API_BASE")) # e.g. http://localhost:12111 for stripe-mock
+        app.config.setdefault("STRIPE_TIMEOUT", 10)
+        app.config.setdefault("STRIPE_MAX_RETRIES", 2)
+        app.config.setdefault("STRIPE_POOL_SIZE", 4)
+        app.config.setdefault("STRIPE_CURRENCY", "usd")
+        self.app = app
+        self._client = None
+        app.extensions["stripe_catalog"] = self
+        app.cli.add_command(stripe_sync_command)
+
+    @property
+    def client(self):
+        # Built on first use so workers fork before opening any connections
+        if self._client is None:
+            import requests
+            import stripe
+            from requests.adapters import HTTPAdapter
+
+            config = self.app.config
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config["STRIPE_POOL_SIZE"])
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            base_addresses = {"api": config["STRIPE_API_BASE"]} if config["STRIPE_API_BASE"] else {}
+            self._client = stripe.StripeClient(
+                config["STRIPE_SECRET_KEY"] or "",
+                http_client=stripe.RequestsClient(timeout=config["STRIPE_TIMEOUT"], session=session),
+                max_network_retries=config["STRIPE_MAX_RETRIES"],
+                base_addresses=base_addresses,
+            )
+        return self._client
+
+    def ensure_price(self, product):
+        """Creates a Stripe Price for `product` unless its current one still matches.
+
+        The caller commits. Prices are immutable in Stripe, so a changed product
+        price gets a new Price object rather than an update.
+        """
+        amount = unit_amount(product.price)
+        if product.stripe_price_id and product.stripe_unit_amount == amount:
+            return product.stripe_price_id
+        with track_external("stripe", "create_price"):
+            price = self.client.prices.create(
+                params={
+                    "currency": self.app.config["STRIPE_CURRENCY"],
+                    "unit_amount": amount,
+                    "product_data": {"name": product.product_name},
+                    "metadata": {"product_id": str(product.id)},
+                },
+                # Retries of the same sync reuse the Price instead of creating duplicates
+                options={"idempotency_key": f"product-{product.id}-price-{amount}"},
+            )
+        product.stripe_price_id = price.id
+        product.stripe_unit_amount = amount
+        return price.id
+
+    def try_ensure_price(self, product):
+        """Like ensure_price(), but logs Stripe failures instead of raising them."""
+        import stripe
+
+        try:
+            return self.ensure_price(product)
+        except stripe.StripeError as e:
+            logger.warning("Could not sync Stripe price for product %s: %s", product.id, e)
+            return None
+
+    def sync_all(self, batch_size=100):
+        """Creates missing or outdated Prices for the whole catalog; returns how many were created."""
+        created = 0
+        last_id = 0
+        while True:
+            products = Product.query.filter(Product.id > last_id).order_by(Product.id).limit(batch_size).all()
+            if not products:
+                return created
+            for product in products:
+                before = product.stripe_price_id
+                if self.try_ensure_price(product) not in (None, before):
+                    created += 1
+            db.session.commit()
+            last_id = products[-1].id
+
+    def create_checkout_session(self, cart, success_url, cancel_url):
+        """Starts a Stripe Checkout session for `cart`; raises CheckoutUnavailable on bad credentials."""
+        import stripe
+
+        line_items = []
+        for line in cart:
+            if line.stripe_price_id and line.stripe_unit_amount == unit_amount(line.price):
+                line_items.append({"price": line.stripe_price_id, "quantity": line.quantity})
+            else:
+                # Not synced yet; fall back to an inline price for this line
+                line_items.append({
+                    "price_data": {
+                        "currency": self.app.config["STRIPE_CURRENCY"],
+                        "product_data": {"name": line.name},
+                        "unit_amount": unit_amount(line.price),
+                    },
+                    "quantity": line.quantity,
+                })
+        try:
+            with track_external("stripe", "create_checkout_session"):
+                return self.client.checkout.sessions.create(params={
+                    "payment_method_types": ["card"],
+                    "line_items": line_items,
+                    "mode": "payment",
+                    "success_url": success_url,
+                    "cancel_url": cancel_url,
+                })
+        except stripe.AuthenticationError as e:
+            raise CheckoutUnavailable(str(e)) from e
+
+
+stripe_catalog = StripeCatalog()
+
+
+@click.command("stripe-sync")
+@with_appcontext
+def stripe_sync_command():
+    """Creates Stripe Prices for products that don't have a current one."""
+    click.echo(f"Created {stripe_catalog.sync_all()} Stripe price(s).")
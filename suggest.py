@@ -0,0 +1,171 @@
+import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from models import db, Product
+from metrics import REGISTRY, stats_gauges
+
+# Typeahead index for the search box. Suggestions are answered from memory with
+# binary search over sorted arrays of lowercase keys:
+#   * names:  each product's full name, so "sona" suggests "Sonata by ..."
+#   * words:  the name from every later word on, so "bach" also finds it
+#   * categories
+# Parallel array('i') columns map each key to its product, and labels and keys
+# are interned so repeated words are stored once. The index is built on first
+# use, extended in place by add() after an upload, and rebuilt from the
+# database every SUGGEST_REBUILD_SECONDS to pick up changes made by other workers.
+
+SUGGEST_LIMIT = 8
+MAX_SUGGEST_LIMIT = 20
+MIN_PREFIX = 1
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize(text):
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+def _name_keys(name):
+    """Yields the full normalized name, then the name from each later word on."""
+    words = normalize(name).split(" ")
+    for start in range(len(words)):
+        if start == 0 or len(words[start]) > 1:
+            yield start, sys.intern(" ".join(words[start:]))
+
+
+class _Snapshot:
+    """Immutable arrays swapped in whole, so lookups never need the lock."""
+
+    __slots__ = ("name_keys", "name_targets", "word_keys", "word_targets", "labels", "product_ids", "categories")
+
+    def __init__(self):
+        self.name_keys = []
+        self.name_targets = array("i")
+        self.word_keys = []
+        self.word_targets = array("i")
+        self.labels = []
+        self.product_ids = array("i")
+        self.categories = []
+
+    def copy(self):
+        snapshot = _Snapshot()
+        for field in self.__slots__:
+            value = getattr(self, field)
+            setattr(snapshot, field, value[:])
+        return snapshot
+
+
+class SuggestionIndex:
+    def __init__(self, app=None):
+        self.rebuild_seconds = 300
+        self._snapshot = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("SUGGEST_REBUILD_SECONDS", 300)
+        self.rebuild_seconds = app.config["SUGGEST_REBUILD_SECONDS"]
+        app.extensions["suggestion_index"] = self
+
+    def rebuild(self):
+        rows = db.session.execute(
+            db.select(Product.id, Product.product_name, Product.category).order_by(Product.id)
+        ).all()
+        names, words, categories = [], [], set()
+        snapshot = _Snapshot()
+        for product_id, name, category in rows:
+            target = len(snapshot.labels)
+            snapshot.labels.append(sys.intern(name))
+            snapshot.product_ids.append(product_id)
+            for start, key in _name_keys(name):
+                (names if start == 0 else words).append((key, target))
+            categories.add(sys.intern(category.lower()))
+        names.sort()
+        words.sort()
+        snapshot.name_keys = [key for key, _ in names]
+        snapshot.name_targets = array("i", (target for _, target in names))
+        snapshot.word_keys = [key for key, _ in words]
+        snapshot.word_targets = array("i", (target for _, target in words))
+        snapshot.categories = sorted(categories)
+        with self._lock:
+            self._snapshot = snapshot
+            self._built_at = time.monotonic()
+
+    def _current(self):
+        if self._snapshot is None:
+            with self._rebuild_lock:
+                if self._snapshot is None:
+                    self.rebuild()
+        elif time.monotonic() - self._built_at > self.rebuild_seconds:
+            # One thread refreshes; the others keep answering from the old arrays
+            if self._rebuild_lock.acquire(blocking=False):
+                try:
+                    self.rebuild()
+                finally:
+                    self._rebuild_lock.release()
+        return self._snapshot
+
+    def refresh(self):
+        """Forgets the index; it is rebuilt from the database on next use."""
+        with self._lock:
+            self._snapshot = None
+
+    def add(self, product):
+        """Indexes a newly created product without a full rebuild."""
+        with self._lock:
+            if self._snapshot is None:
+                return # Built from the database on first use anyway
+            snapshot = self._snapshot.copy()
+            target = len(snapshot.labels)
+            snapshot.labels.append(sys.intern(product.product_name))
+            snapshot.product_ids.append(product.id)
+            for start, key in _name_keys(product.product_name):
+                keys, targets = (snapshot.name_keys, snapshot.name_targets) if start == 0 else (snapshot.word_keys, snapshot.word_targets)
+                index = bisect_left(keys, key)
+                keys.insert(index, key)
+                targets.insert(index, target)
+            category = sys.intern(product.category.lower())
+            if category not in snapshot.categories:
+                insort(snapshot.categories, category)
+            self._snapshot = snapshot
+
+    def suggest(self, query, limit=SUGGEST_LIMIT):
+        """Returns up to `limit` suggestions: matching categories, then product names, then inner-word matches."""
+        prefix = normalize(query)
+        if len(prefix) < MIN_PREFIX:
+            return []
+        snapshot = self._current()
+        results = []
+
+        start = bisect_left(snapshot.categories, prefix)
+        for category in snapshot.categories[start:start + 2]:
+            if not category.startswith(prefix):
+                break
+            results.append({"type": "category", "label": category})
+
+        seen = set()
+        for keys, targets in ((snapshot.name_keys, snapshot.name_targets), (snapshot.word_keys, snapshot.word_targets)):
+            index = bisect_left(keys, prefix)
+            while index < len(keys) and len(results) < limit and keys[index].startswith(prefix):
+                target = targets[index]
+                if target not in seen:
+                    seen.add(target)
+                    results.append({"type": "product", "id": snapshot.product_ids[target], "label": snapshot.labels[target]})
+                index += 1
+        return results[:limit]
+
+    def stats(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {"products": 0, "keys": 0}
+        return {"products": len(snapshot.labels), "keys": len(snapshot.name_keys) + len(snapshot.word_keys)}
+
+
+suggestion_index = SuggestionIndex()
+REGISTRY.add_collector(lambda: stats_gauges("bytemarket_suggest", "Typeahead index size.", suggestion_index.stats()))
@@ -0,0 +1,175 @@
+import io
+import sqlite3
+import pytest
+from flask_migrate import upgrade
+from PIL import Image
+from sqlalchemy import event
+from app import create_app
+from models import db, User, Product
+from fulfillment import LocalMailTransport
+from featured import featured_products
+from suggest import suggestion_index
+from http_cache import http_cache
+from storage import blob_store, LocalBackend
+
+# The tables of the original bundled database. The first migration upgrades
+# from here, so applying this and then `flask db upgrade` builds a database the
+# way existing deployments got theirs.
+BASELINE_SCHEMA = [
+    """
+    CREATE TABLE user (
+        id INTEGER NOT NULL,
+        username VARCHAR(50) NOT NULL,
+        email VARCHAR(120) NOT NULL,
+        password_hash VARCHAR(128) NOT NULL,
+        role VARCHAR(10) NOT NULL,
+        PRIMARY KEY (id),
+        UNIQUE (username),
+        UNIQUE (email)
+    )
+    """,
+    """
+    CREATE TABLE product (
+        id INTEGER NOT NULL,
+        product_name VARCHAR(200) NOT NULL,
+        description TEXT NOT NULL,
+        price FLOAT NOT NULL,
+        image_path VARCHAR(255),
+        file_path VARCHAR(1024),
+        category VARCHAR(255) NOT NULL,
+        user_id INTEGER NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY(user_id) REFERENCES user (id)
+    )
+    """,
+    """
+    CREATE TABLE cart_item (
+        id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY(user_id) REFERENCES user (id),
+        FOREIGN KEY(product_id) REFERENCES product (id)
+    )
+    """,
+]
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'database.db'}",
+        "WTF_CSRF_ENABLED": False,
+        "BCRYPT_LOG_ROUNDS": 4,
+        "PASSWORD_HASH_WORKERS": 0,
+        "FULFILLMENT_TRANSPORT": LocalMailTransport(),
+        "FULFILLMENT_WORKERS": 0,
+        "ATTACHMENT_CACHE_DIR": str(tmp_path / "attachment_cache"),
+        "STORAGE_ROOT": str(tmp_path / "storage"),
+    })
+    with app.app_context():
+        with db.engine.begin() as conn:
+            for statement in BASELINE_SCHEMA:
+                conn.exec_driver_sql(statement)
+        upgrade()
+    # Per-process caches outlive the app that filled them
+    featured_products.refresh()
+    suggestion_index.refresh()
+    http_cache._version = None
+    yield app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def seller(app):
+    with app.app_context():
+        user = User(username="seller", email="seller@example.com", password_hash="x", role="seller")
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+@pytest.fixture
+def static_folder(app, tmp_path, monkeypatch):
+    """Points the static folder at a temporary directory, so uploads stay out of the tree."""
+    folder = tmp_path / "static"
+    folder.mkdir()
+    monkeypatch.setattr(app, "static_folder", str(folder))
+    monkeypatch.setattr(blob_store, "backend", LocalBackend(str(folder), app.config["STORAGE_ROOT"]))
+    return folder
+
+
+def png_bytes():
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), "red").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def write_lock_is_free(app):
+    """Tries to take the SQLite write lock from another connection, without waiting."""
+    probe = sqlite3.connect(app.config["SQLALCHEMY_DATABASE_URI"].removeprefix("sqlite:///"), timeout=0)
+    try:
+        probe.execute("BEGIN IMMEDIATE")
+        probe.rollback()
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        probe.close()
+
+
+def login(client, user_id):
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user_id)
+        session["_fresh"] = True
+
+
+def add_products(app, user_id, count, **values):
+    """Inserts `count` products and returns their ids."""
+    with app.app_context():
+        products = [
+            Product(
+                product_name=values.get("product_name", f"Product {i}"),
+                description=values.get("description", "A sample product"),
+                price=values.get("price", 5.0 + i),
+                category=values.get("category", "ebooks"),
+                image_path="product_images/bach.svg",
+                file_path=values.get("file_path", f"ebooks/product-{i}.pdf"),
+                user_id=user_id,
+            )
+            for i in range(count)
+        ]
+        db.session.add_all(products)
+        db.session.commit()
+        return [product.id for product in products]
+
+
+class StatementCounter:
+    """Counts the SQL statements run on every engine of the app."""
+
+    def __init__(self, app):
+        with app.app_context():
+            self.engines = list(db.engines.values())
+        self.count = 0
+
+    def _count(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        for engine in self.engines:
+            event.listen(engine, "before_cursor_execute", self._count)
+        return self
+
+    def __exit__(self, *exc):
+        for engine in self.engines:
+            event.remove(engine, "before_cursor_execute", self._count)
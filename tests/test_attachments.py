@@ -0,0 +1,47 @@
+import base64
+import os
+from flask import Flask
+from attachments import AttachmentCache
+
+
+def make_cache(tmp_path, disk_bytes):
+    app = Flask(__name__, instance_path=str(tmp_path / "instance"))
+    app.config["ATTACHMENT_CACHE_DISK_BYTES"] = disk_bytes
+    return AttachmentCache(app)
+
+
+def cached_files(cache):
+    return [entry[2] for entry in cache._entries()]
+
+
+def test_changed_file_replaces_its_cached_payload(tmp_path):
+    cache = make_cache(tmp_path, 1024 * 1024)
+    source = tmp_path / "book.pdf"
+    source.write_bytes(b"first edition")
+    assert cache.encoded(str(source)) == base64.b64encode(b"first edition").decode()
+
+    source.write_bytes(b"second, longer edition")
+    os.utime(source, ns=(1, 10 ** 18)) # A different mtime even on coarse filesystems
+    cache.memory.clear()
+    assert cache.encoded(str(source)) == base64.b64encode(b"second, longer edition").decode()
+    assert len(cached_files(cache)) == 1
+
+    cache.memory.clear()
+    assert cache.encoded(str(source)) == base64.b64encode(b"second, longer edition").decode()
+
+
+def test_disk_cache_is_pruned_least_recently_used_first(tmp_path):
+    cache = make_cache(tmp_path, 3000)
+    paths = []
+    for i in range(5):
+        source = tmp_path / f"file-{i}.bin"
+        source.write_bytes(bytes([i]) * 900) # 1200 bytes encoded
+        paths.append(str(source))
+        cache.encoded(paths[-1])
+        # Entries written in the same instant would tie on mtime
+        os.utime(cache._disk_path(paths[-1]), (i, i))
+
+    remaining = cached_files(cache)
+    assert sum(os.path.getsize(path) for path in remaining) <= 3000
+    assert cache._disk_path(paths[-1]) in remaining
+    assert cache._disk_path(paths[0]) not in remaining
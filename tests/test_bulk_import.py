@@ -0,0 +1,46 @@
+import io
+import json
+import zipfile
+import bulk_import
+from models import Blob, Product
+from conftest import png_bytes, write_lock_is_free
+
+
+def make_archive(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return zipfile.ZipFile(buffer)
+
+
+def manifest(*rows):
+    return io.BytesIO("".join(json.dumps(row) + "\n" for row in rows).encode())
+
+
+def row(name, image, file):
+    return {"product_name": name, "description": "Imported", "price": 3, "category": "ebooks", "image": image, "file": file}
+
+
+def test_import_processes_images_before_the_write_transaction(app, seller, static_folder, monkeypatch):
+    lock_free = []
+    process_image_job = bulk_import._process_image_job
+
+    def checking_job(job):
+        lock_free.append(write_lock_is_free(app))
+        return process_image_job(job)
+
+    monkeypatch.setattr(bulk_import, "_process_image_job", checking_job)
+    archive = make_archive({"a.png": png_bytes(), "broken.png": b"not an image", "a.pdf": b"a", "b.pdf": b"b"})
+    rows = manifest(row("Good", "a.png", "a.pdf"), row("Broken", "broken.png", "b.pdf"))
+
+    with app.app_context():
+        events = list(bulk_import.run_import(rows, "jsonl", archive, seller, workers=0))
+        summary = events[-1]
+        assert (summary.imported, summary.failed) == (1, 1)
+        assert [event.row for event in events[:-1]] == [2]
+        assert [product.product_name for product in Product.query.all()] == ["Good"]
+        # The failed row never took references, so there is nothing to release
+        assert sorted(blob.ref_count for blob in Blob.query.all()) == [1, 1]
+    assert lock_free == [True, True]
@@ -0,0 +1,29 @@
+import pytest
+from cart_service import add_item, load_cart
+from models import db
+from conftest import add_products, login
+
+
+@pytest.fixture
+def cart_line(app, seller):
+    (product_id,) = add_products(app, seller, 1)
+    with app.app_context():
+        add_item(seller, product_id, 1)
+        db.session.commit()
+        return load_cart(seller).lines[0].id
+
+
+@pytest.mark.parametrize("quantity", ["3x", None, 0, True, [2]])
+def test_update_rejects_invalid_quantity(app, client, seller, cart_line, quantity):
+    login(client, seller)
+    response = client.post(f"/api/cart/update/{cart_line}", json={"quantity": quantity})
+    assert response.status_code == 400
+    assert response.get_json()["success"] is False
+
+
+def test_update_sets_quantity(app, client, seller, cart_line):
+    login(client, seller)
+    response = client.post(f"/api/cart/update/{cart_line}", json={"quantity": "4"})
+    assert response.status_code == 200
+    with app.app_context():
+        assert load_cart(seller).lines[0].quantity == 4
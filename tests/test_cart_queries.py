@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+import pytest
+from cart_service import add_item
+from models import db
+from stripe_catalog import stripe_catalog
+from conftest import StatementCounter, add_products, login
+
+
+def fill_cart(app, user_id, product_ids):
+    with app.app_context():
+        for product_id in product_ids:
+            add_item(user_id, product_id, 2)
+        db.session.commit()
+
+
+def statements_for(app, client, route):
+    method, url = route
+    client.open(url, method=method).close() # Warms the user and catalog caches
+    with StatementCounter(app) as counter:
+        response = client.open(url, method=method)
+        response.close()
+    assert response.status_code in (200, 303)
+    return counter.count
+
+
+@pytest.mark.parametrize("route", [
+    ("GET", "/cart"),
+    ("GET", "/api/cart"),
+    ("GET", "/payment"),
+    ("POST", "/create-checkout-session"),
+])
+def test_cart_pages_run_constant_queries(app, client, seller, monkeypatch, route):
+    monkeypatch.setattr(
+        stripe_catalog, "create_checkout_session",
+        lambda cart, success_url, cancel_url: SimpleNamespace(url="https://checkout.stripe.test/session"),
+    )
+    login(client, seller)
+    product_ids = add_products(app, seller, 6)
+
+    fill_cart(app, seller, product_ids[:1])
+    one_line = statements_for(app, client, route)
+    fill_cart(app, seller, product_ids[1:])
+    many_lines = statements_for(app, client, route)
+
+    assert many_lines == one_line
@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+from cart_service import load_cart
+from fulfillment import fulfillment_queue
+from models import FulfillmentJob
+from stripe_catalog import stripe_catalog
+from conftest import add_products, login
+
+
+def test_checkout_through_thank_you(app, client, seller, monkeypatch):
+    monkeypatch.setattr(
+        stripe_catalog, "create_checkout_session",
+        lambda cart, success_url, cancel_url: SimpleNamespace(url="https://checkout.stripe.test/cs_test_1"),
+    )
+    login(client, seller)
+    product_ids = add_products(app, seller, 2)
+    for product_id in product_ids:
+        assert client.post("/api/cart/add", json={"product_id": product_id, "quantity": 1}).status_code == 200
+
+    assert client.get("/payment").status_code == 200
+    response = client.post("/create-checkout-session")
+    assert response.status_code == 303
+    assert response.headers["Location"] == "https://checkout.stripe.test/cs_test_1"
+
+    response = client.get("/thank_you?session_id=cs_test_1")
+    assert response.status_code == 200
+    assert b"Product 0" in response.data
+    # Reloading the page shows the same order instead of queueing another
+    assert client.get("/thank_you?session_id=cs_test_1").status_code == 200
+
+    with app.app_context():
+        assert not load_cart(seller)
+        (job,) = FulfillmentJob.query.all()
+        assert (job.order_key, job.status) == ("cs_test_1", "pending")
+        file_paths = job.file_paths
+        assert file_paths == ["ebooks/product-0.pdf", "ebooks/product-1.pdf"]
+
+        assert fulfillment_queue.process_due_jobs() == 1
+        assert FulfillmentJob.query.one().status == "sent"
+    outbox = app.config["FULFILLMENT_TRANSPORT"].outbox
+    assert outbox == [{"recipient": "seller@example.com", "file_paths": file_paths}]
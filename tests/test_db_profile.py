@@ -0,0 +1,47 @@
+import threading
+import time
+from fulfillment import fulfillment_queue
+from models import db, User
+
+
+def test_writer_does_not_wait_for_an_idle_connection(app):
+    holding, release = threading.Event(), threading.Event()
+
+    def hold_connection():
+        # Like a request between its first query and a slow bcrypt or Stripe call
+        with app.app_context():
+            db.session.execute(db.select(User.id)).all()
+            holding.set()
+            release.wait(10)
+            db.session.rollback()
+
+    thread = threading.Thread(target=hold_connection)
+    thread.start()
+    try:
+        assert holding.wait(5)
+        started = time.monotonic()
+        with app.app_context():
+            db.session.add(User(username="writer", email="writer@example.com", password_hash="x"))
+            db.session.commit()
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
+        thread.join()
+
+
+class PoolCheckingTransport:
+    def __init__(self):
+        self.checked_out = []
+
+    def send(self, recipient, file_paths, user_id=None):
+        self.checked_out.append(db.engine.pool.checkedout())
+
+
+def test_fulfillment_sends_without_holding_a_connection(app, seller, monkeypatch):
+    transport = PoolCheckingTransport()
+    monkeypatch.setattr(fulfillment_queue, "transport", transport)
+    with app.app_context():
+        fulfillment_queue.enqueue("order-1", seller, "buyer@example.com", ["ebooks/a.pdf"], [])
+        db.session.commit()
+        assert fulfillment_queue.process_due_jobs() == 1
+    assert transport.checked_out == [0]
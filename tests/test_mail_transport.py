@@ -0,0 +1,22 @@
+import pytest
+from mail_transport import MailjetBackend
+
+
+@pytest.fixture
+def retry():
+    return MailjetBackend("key", "secret").session.get_adapter("https://api.mailjet.com").max_retries
+
+
+def test_rate_limited_sends_are_retried(retry):
+    assert retry.is_retry("POST", 429, has_retry_after=False)
+
+
+@pytest.mark.parametrize("status", [500, 502, 503, 504])
+def test_gateway_errors_are_not_retried(retry, status):
+    # Mailjet may already have accepted the batch, so a retry could send it twice
+    assert not retry.is_retry("POST", status, has_retry_after=False)
+
+
+def test_read_errors_are_not_retried(retry):
+    assert retry.read == 0
+    assert retry.connect > 0
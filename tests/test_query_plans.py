@@ -0,0 +1,14 @@
+import pytest
+from models import db
+from query_plans import explain, full_scans, hot_queries
+
+
+@pytest.mark.parametrize("statement, allow_scan", [
+    pytest.param(statement, allow_scan, id=name) for name, statement, allow_scan in hot_queries()
+])
+def test_hot_query_uses_an_index(app, statement, allow_scan):
+    # The fixture database is built by the migrations, so a revision that
+    # forgets an index (or a table) fails here
+    with app.app_context(), db.engine.connect() as conn:
+        plan = explain(conn, statement)
+    assert allow_scan or not full_scans(plan), "\n".join(plan)
@@ -0,0 +1,24 @@
+from models import db, Product
+from conftest import add_products
+
+
+def search_ids(client, query):
+    response = client.get("/api/search", query_string={"q": query})
+    assert response.status_code == 200
+    return [result["id"] for result in response.get_json()["results"]]
+
+
+def test_new_products_are_searchable_after_migrating(app, client, seller):
+    (product_id,) = add_products(app, seller, 1, product_name="Goldberg Variations")
+    assert search_ids(client, "goldberg") == [product_id]
+
+
+def test_renamed_products_are_reindexed(app, client, seller):
+    (product_id,) = add_products(app, seller, 1, product_name="Goldberg Variations")
+    with app.app_context():
+        product = db.session.get(Product, product_id)
+        product.product_name = "Well-Tempered Clavier"
+        product.price = 12.5
+        db.session.commit()
+    assert search_ids(client, "clavier") == [product_id]
+    assert search_ids(client, "goldberg") == []
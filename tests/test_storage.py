@@ -0,0 +1,98 @@
+import io
+import os
+import images
+from downloads import make_download_token
+from models import db, Blob, Product
+from storage import blob_store
+from conftest import login, png_bytes, write_lock_is_free
+
+
+def upload(client, filename="book.pdf", data=b"%PDF-1.4 book"):
+    return client.post("/upload_product", content_type="multipart/form-data", data={
+        "product_name": "Uploaded",
+        "description": "An uploaded product",
+        "price": "4.5",
+        "category": "ebooks",
+        "image": (io.BytesIO(png_bytes()), "cover.png"),
+        "file": (io.BytesIO(data), filename),
+    })
+
+
+def test_uploaded_files_are_only_served_by_the_signed_route(app, client, seller, static_folder):
+    login(client, seller)
+    assert upload(client).status_code == 302
+
+    with app.app_context():
+        product = Product.query.filter_by(product_name="Uploaded").one()
+        file_path, image_path = product.file_path, product.image_path
+        token = make_download_token(file_path, seller)
+    assert file_path.startswith("files/") and file_path.endswith("/book.pdf")
+    assert os.path.isfile(os.path.join(app.config["STORAGE_ROOT"], file_path))
+    assert not os.path.exists(static_folder / file_path)
+    assert os.path.isfile(static_folder / image_path)
+
+    assert client.get("/static/" + file_path).status_code == 404
+    response = client.get(f"/download/{token}")
+    assert response.status_code == 200
+    assert response.data == b"%PDF-1.4 book"
+
+
+def test_upload_rejects_unsupported_file_types(app, client, seller, static_folder):
+    login(client, seller)
+    response = upload(client, "page.html", b"<script>alert(1)</script>")
+    assert response.status_code == 200
+    assert b"Unsupported file type" in response.data
+    with app.app_context():
+        assert not Product.query.count()
+        assert not Blob.query.count()
+
+
+def test_upload_processes_the_image_before_taking_references(app, client, seller, static_folder, monkeypatch):
+    lock_free = []
+    process_image = images.process_image
+
+    def checking_process_image(*args):
+        lock_free.append(write_lock_is_free(app))
+        return process_image(*args)
+
+    monkeypatch.setattr(images, "process_image", checking_process_image)
+    login(client, seller)
+    assert upload(client).status_code == 302
+    assert lock_free == [True]
+    with app.app_context():
+        assert Product.query.one().image_variants
+
+
+def test_identical_uploads_share_a_blob(app, static_folder):
+    with app.app_context():
+        first = blob_store.commit(blob_store.stage(io.BytesIO(b"same"), "a.pdf", "file"))
+        second = blob_store.commit(blob_store.stage(io.BytesIO(b"same"), "b.pdf", "file"))
+        db.session.commit()
+        assert first.path == second.path
+        assert Blob.query.one().ref_count == 2
+    staging = os.path.join(app.config["STORAGE_ROOT"], "files", ".staging")
+    assert not os.listdir(staging)
+
+
+def test_collect_keeps_blobs_referenced_again(app, static_folder, monkeypatch):
+    with app.app_context():
+        kept = blob_store.commit(blob_store.stage(io.BytesIO(b"kept"), "kept.pdf", "file"))
+        dropped = blob_store.commit(blob_store.stage(io.BytesIO(b"dropped"), "dropped.pdf", "file"))
+        blob_store.release(kept.path)
+        blob_store.release(dropped.path)
+        db.session.commit()
+
+        unused = blob_store._unused
+
+        def unused_then_referenced():
+            # An upload of the same content lands between the select and the delete
+            candidates = unused()
+            db.session.execute(db.update(Blob).where(Blob.path == kept.path).values(ref_count=1))
+            return candidates
+
+        monkeypatch.setattr(blob_store, "_unused", unused_then_referenced)
+        assert blob_store.collect() == 1
+        assert [blob.path for blob in Blob.query.all()] == [kept.path]
+    root = app.config["STORAGE_ROOT"]
+    assert os.path.isfile(os.path.join(root, kept.path))
+    assert not os.path.exists(os.path.join(root, dropped.path))